@@ -314,6 +314,7 @@ class Artists(Gtk.Box):
 
     def append_artists(self, init=False):
         if init:
+            Net.cancel_tasks(self.artists_liststore)
             self.artists_liststore.clear()
             self.artists_page = 0
             self.artists_win.get_vadjustment().set_value(0)
@@ -446,6 +447,7 @@ class Artists(Gtk.Box):
                 self.append_artist_albums()
 
         if init:
+            Net.cancel_tasks(self.artist_albums_liststore)
             self.artist_albums_liststore.clear()
             self.artist_albums_page = 0
         Net.async_call(Net.get_artist_albums, _append_artist_albums,
@@ -478,6 +480,7 @@ class Artists(Gtk.Box):
                 self.append_artist_mv()
 
         if init:
+            Net.cancel_tasks(self.artist_mv_liststore)
             self.artist_mv_liststore.clear()
             self.artist_mv_page = 0
         Net.async_call(Net.get_artist_mv, _append_artist_mv,
@@ -511,6 +514,7 @@ class Artists(Gtk.Box):
                 self.append_artist_similar()
 
         if init:
+            Net.cancel_tasks(self.artist_similar_liststore)
             self.artist_similar_liststore.clear()
             self.artist_similar_page = 0
         Net.async_call(Net.get_artist_similar, _append_artist_similar,
@@ -0,0 +1,597 @@
+
+import collections
+import os
+import socket
+import socketserver
+import sqlite3
+import struct
+import threading
+import time
+
+try:
+    # Debian: http://code.google.com/p/py-leveldb/
+    import leveldb
+    plyvel = None
+    leveldb_imported = True
+except ImportError as e:
+    leveldb = None
+    try:
+        # Fedora: https://github.com/wbolster/plyvel
+        import plyvel
+        leveldb_imported = True
+    except ImportError as e:
+        plyvel = None
+        leveldb_imported = False
+
+# Each cached value is prefixed by this header:
+# magic, store time, access time, ttl class, size of body
+HEADER = struct.Struct('!4sddBI')
+MAGIC = b'KWC1'
+
+# ttl classes, index of them is saved in header.
+TTL_CLASSES = (
+        'default',
+        'nodes',
+        'lists',
+        'artist-info',
+        'song-link',
+        'radio',
+        'image-list',
+        )
+
+# Access time in header is only rewritten if it is older than this,
+# so that reading cache does not cause a write each time.
+ACCESS_GRANULARITY = 3600
+
+def pack(value, ttl_class, store_time=None, access_time=None):
+    now = time.time()
+    if store_time is None:
+        store_time = now
+    if access_time is None:
+        access_time = now
+    header = HEADER.pack(MAGIC, store_time, access_time,
+            TTL_CLASSES.index(ttl_class), len(value))
+    return header + value
+
+def unpack_header(data):
+    '''
+    Returns (store_time, access_time, ttl_class, size), or None if data
+    is saved by older version without header.
+    '''
+    if len(data) < HEADER.size or data[:4] != MAGIC:
+        return None
+    magic, store_time, access_time, ttl_index, size = HEADER.unpack_from(
+            data)
+    if ttl_index >= len(TTL_CLASSES):
+        return None
+    return (store_time, access_time, TTL_CLASSES[ttl_index], size)
+
+
+class LevelDBBackend:
+    '''
+    Hide the API differences of py-leveldb and plyvel.
+    '''
+    def __init__(self, path):
+        if leveldb is not None:
+            self.db = leveldb.LevelDB(path, create_if_missing=True)
+        else:
+            self.db = plyvel.DB(path, create_if_missing=True)
+
+    def get(self, key):
+        if leveldb is not None:
+            try:
+                return bytes(self.db.Get(key))
+            except KeyError:
+                return None
+        return self.db.get(key)
+
+    def put(self, key, value):
+        if leveldb is not None:
+            self.db.Put(key, value)
+        else:
+            self.db.put(key, value)
+
+    def delete(self, key):
+        if leveldb is not None:
+            self.db.Delete(key)
+        else:
+            self.db.delete(key)
+
+    def scan(self):
+        '''
+        Yields (key, header, size) of all entries.
+        '''
+        if leveldb is not None:
+            for key, value in self.db.RangeIter():
+                yield (bytes(key), bytes(value[:HEADER.size]), len(value))
+        else:
+            for key, value in self.db.iterator():
+                yield (key, value[:HEADER.size], len(value))
+
+    def close(self):
+        if plyvel is not None:
+            self.db.close()
+        self.db = None
+
+
+class SqliteBackend:
+    '''
+    Backend using sqlite3 in WAL mode, it is always available, and can be
+    used by several processes at the same time.
+    '''
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False,
+                isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS `cache` (
+                key BLOB PRIMARY KEY,
+                value BLOB
+                )''')
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute(
+                    'SELECT value FROM `cache` WHERE key=?',
+                    (key, )).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def put(self, key, value):
+        with self.lock:
+            self.conn.execute(
+                    'INSERT OR REPLACE INTO `cache` VALUES(?, ?)',
+                    (key, value))
+
+    def delete(self, key):
+        with self.lock:
+            self.conn.execute('DELETE FROM `cache` WHERE key=?', (key, ))
+
+    def scan(self):
+        with self.lock:
+            rows = self.conn.execute(
+                    'SELECT key, substr(value, 1, ?), length(value) '
+                    'FROM `cache`', (HEADER.size, )).fetchall()
+        for key, header, size in rows:
+            yield (key, header, size)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+        self.conn = None
+
+
+# Frames of cache broker:
+# request: op, key length, value length, key, value
+# response: status, data length, data
+BROKER_REQUEST = struct.Struct('!cII')
+BROKER_RESPONSE = struct.Struct('!?I')
+# scan record: key length, header length, size of entry
+BROKER_RECORD = struct.Struct('!III')
+
+def _recv_exact(sock, size):
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            raise ConnectionError('Cache broker: connection closed')
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+class BrokerHandler(socketserver.BaseRequestHandler):
+    '''
+    Serve requests of other processes with backend of the server.
+    '''
+    def handle(self):
+        backend = self.server.backend
+        sock = self.request
+        while True:
+            try:
+                head = _recv_exact(sock, BROKER_REQUEST.size)
+            except ConnectionError:
+                return
+            op, key_len, value_len = BROKER_REQUEST.unpack(head)
+            key = _recv_exact(sock, key_len)
+            value = _recv_exact(sock, value_len)
+            data = None
+            if op == b'G':
+                data = backend.get(key)
+            elif op == b'P':
+                backend.put(key, value)
+            elif op == b'D':
+                backend.delete(key)
+            elif op == b'S':
+                records = []
+                for _key, header, size in backend.scan():
+                    records.append(BROKER_RECORD.pack(len(_key),
+                        len(header), size))
+                    records.append(_key)
+                    records.append(header)
+                data = b''.join(records)
+            if data is None:
+                sock.sendall(BROKER_RESPONSE.pack(False, 0))
+            else:
+                sock.sendall(BROKER_RESPONSE.pack(True, len(data)) + data)
+
+
+class BrokerServer(socketserver.ThreadingMixIn,
+        socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, backend):
+        self.backend = backend
+        # The process which opens LevelDB owns this socket, so an old
+        # one must be left by a dead process.
+        if os.path.exists(path):
+            os.remove(path)
+        super().__init__(path, BrokerHandler)
+        os.chmod(path, 0o600)
+
+
+def start_broker(backend, path):
+    '''
+    Share backend with other processes through unix socket at path.
+    '''
+    try:
+        server = BrokerServer(path, backend)
+    except OSError as e:
+        print('Warning: Failed to start cache broker:', e)
+        return None
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+class BrokerBackend:
+    '''
+    Used when LevelDB is locked by another process, all requests are
+    sent to the cache broker of that process.
+    If the broker is gone, `failover()` is called once to open another
+    backend, and later requests are sent to it. Without failover, it
+    works like an empty cache.
+    '''
+    def __init__(self, path, failover=None):
+        self.path = path
+        self.failover = failover
+        # backend opened by failover() after the broker is gone.
+        self.fallback = None
+        self.gone = False
+        self.lock = threading.Lock()
+        self.sock = None
+        self.connect()
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        self.sock = sock
+
+    def request(self, op, key=b'', value=b''):
+        with self.lock:
+            if self.gone:
+                return None
+            try:
+                if self.sock is None:
+                    self.connect()
+                self.sock.sendall(BROKER_REQUEST.pack(op, len(key),
+                    len(value)) + key + value)
+                status, size = BROKER_RESPONSE.unpack(
+                        _recv_exact(self.sock, BROKER_RESPONSE.size))
+                data = _recv_exact(self.sock, size)
+            except OSError as e:
+                print('Warning: Cache broker is gone:', e)
+                if self.sock is not None:
+                    self.sock.close()
+                    self.sock = None
+                self.gone = True
+                if self.failover is not None:
+                    self.fallback = self.failover()
+                return None
+        if not status:
+            return None
+        return data
+
+    def get(self, key):
+        if self.fallback is not None:
+            return self.fallback.get(key)
+        return self.request(b'G', key)
+
+    def put(self, key, value):
+        if self.fallback is not None:
+            self.fallback.put(key, value)
+        else:
+            self.request(b'P', key, value)
+
+    def delete(self, key):
+        if self.fallback is not None:
+            self.fallback.delete(key)
+        else:
+            self.request(b'D', key)
+
+    def scan(self):
+        if self.fallback is not None:
+            yield from self.fallback.scan()
+            return
+        data = self.request(b'S')
+        if data is None:
+            return
+        pos = 0
+        while pos < len(data):
+            key_len, header_len, size = BROKER_RECORD.unpack_from(data, pos)
+            pos += BROKER_RECORD.size
+            key = data[pos:pos+key_len]
+            pos += key_len
+            header = data[pos:pos+header_len]
+            pos += header_len
+            yield (key, header, size)
+
+    def close(self):
+        with self.lock:
+            if self.sock is not None:
+                self.sock.close()
+                self.sock = None
+            if self.fallback is not None:
+                self.fallback.close()
+
+
+def open_backend(leveldb_path, sqlite_path, broker_path=None):
+    '''
+    Use LevelDB if leveldb or plyvel is installed, or else sqlite3.
+    If LevelDB is locked by another process, its cache broker at
+    broker_path is used, so that all processes share the same cache.
+    If that broker is gone later, this function is called again, to
+    take over LevelDB or to use sqlite3.
+    Other tools can open the shared cache with this function too.
+    '''
+    if leveldb_imported:
+        try:
+            backend = LevelDBBackend(leveldb_path)
+            if broker_path:
+                start_broker(backend, broker_path)
+            return backend
+        except Exception as e:
+            print('Warning: Failed to open LevelDB:', e)
+        if broker_path:
+            try:
+                return BrokerBackend(broker_path, lambda: open_backend(
+                    leveldb_path, sqlite_path, broker_path))
+            except OSError as e:
+                print('Warning: Failed to connect to cache broker:', e)
+    else:
+        print('Warning: No leveldb/plyvel module was found, use sqlite3')
+    return SqliteBackend(sqlite_path)
+
+
+class RequestCache:
+    '''
+    Cache of http responses with expiry and size limit.
+    backend is LevelDBBackend, SqliteBackend or BrokerBackend.
+
+    Each entry is saved with a header, containing its store time, last
+    access time, ttl class and size.
+    ttls maps ttl class to seconds, entries older than that are expired.
+    A daemon thread removes expired entries, and then least recently
+    used ones until total size is lower than max_size.
+    '''
+    def __init__(self, backend, max_size, ttls):
+        self.backend = backend
+        self.max_size = max_size
+        self.ttls = ttls
+        # total size is unknown until the first scan is finished.
+        self.size = 0
+        self.scanned = False
+        self.lock = threading.Lock()
+        self.evict_event = threading.Event()
+        # functions called with key when an entry is removed or replaced.
+        self.listeners = []
+        self.stats = {
+                'hits': 0,
+                'misses': 0,
+                'expired': 0,
+                'evicted': 0,
+                }
+
+    def add_listener(self, func):
+        '''
+        func(key) is called when entry of key is removed, expired or
+        replaced, caches built upon this one use it to invalidate their
+        entries.
+        '''
+        self.listeners.append(func)
+
+    def notify(self, key):
+        for func in self.listeners:
+            func(key)
+
+    def is_expired(self, header, now=None):
+        if now is None:
+            now = time.time()
+        store_time, access_time, ttl_class, size = header
+        ttl = self.ttls.get(ttl_class, self.ttls['default'])
+        return store_time + ttl < now
+
+    def get(self, key):
+        data = self.backend.get(key)
+        if data is None:
+            self.stats['misses'] += 1
+            return None
+        header = unpack_header(data)
+        if header is None or self.is_expired(header):
+            self.stats['expired'] += 1
+            self.notify(key)
+            return None
+        self.stats['hits'] += 1
+        value = data[HEADER.size:]
+        store_time, access_time, ttl_class, size = header
+        if access_time + ACCESS_GRANULARITY < time.time():
+            self.backend.put(key, pack(value, ttl_class, store_time))
+        return value
+
+    def put(self, key, value, ttl_class='default'):
+        old = self.backend.get(key)
+        self.backend.put(key, pack(value, ttl_class))
+        if old is not None:
+            self.notify(key)
+        with self.lock:
+            if old is not None:
+                self.size -= len(old)
+            self.size += HEADER.size + len(value)
+            over_budget = self.scanned and self.size > self.max_size
+        if over_budget:
+            self.evict_event.set()
+
+    def delete(self, key):
+        old = self.backend.get(key)
+        if old is None:
+            return
+        self.backend.delete(key)
+        self.notify(key)
+        with self.lock:
+            self.size -= len(old)
+
+    def evict(self):
+        '''
+        Scan the whole database, expired entries are deleted first.
+        If it still uses too much space, least recently used entries are
+        deleted until it is 90% full.
+        Entries without header are treated as expired.
+        '''
+        now = time.time()
+        total = 0
+        entries = []
+        expired = []
+        for key, header_data, size in self.backend.scan():
+            header = unpack_header(header_data)
+            if header is None or self.is_expired(header, now):
+                expired.append((key, size))
+                continue
+            total += size
+            entries.append((header[1], key, size))
+        for key, size in expired:
+            self.backend.delete(key)
+            self.notify(key)
+        self.stats['expired'] += len(expired)
+
+        if total > self.max_size:
+            target = self.max_size * 0.9
+            entries.sort()
+            for access_time, key, size in entries:
+                if total <= target:
+                    break
+                self.backend.delete(key)
+                self.notify(key)
+                total -= size
+                self.stats['evicted'] += 1
+        with self.lock:
+            self.size = total
+            self.scanned = True
+
+    def start_evict_daemon(self, interval=1800):
+        '''
+        Evict entries at startup, every `interval` seconds, or when cache
+        is over budget.
+        '''
+        def _evict_loop():
+            while self.backend is not None:
+                try:
+                    self.evict()
+                except Exception as e:
+                    print('Error: Cache.evict():', e)
+                self.evict_event.wait(interval)
+                self.evict_event.clear()
+
+        thread = threading.Thread(target=_evict_loop)
+        thread.daemon = True
+        thread.start()
+
+
+class LRUCache:
+    '''
+    In-memory cache limited by total size of its values.
+
+    Least recently used entries are dropped when max_size is exceeded.
+    If ttl (in seconds) is set, entries older than that are expired.
+    sizeof is used to get size of values, default is len().
+    It is thread safe.
+    '''
+    def __init__(self, max_size, ttl=None, sizeof=len):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.sizeof = sizeof
+        # key -> (value, size, expire_time)
+        self.data = collections.OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.stats = {
+                'hits': 0,
+                'misses': 0,
+                'expired': 0,
+                'evicted': 0,
+                }
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        with self.lock:
+            item = self.data.get(key)
+            return item is not None and not self._is_expired(item)
+
+    def _is_expired(self, item):
+        return item[2] is not None and item[2] < time.time()
+
+    def _remove(self, key):
+        value, size, expire_time = self.data.pop(key)
+        self.size -= size
+
+    def get(self, key, default=None):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                self.stats['misses'] += 1
+                return default
+            if self._is_expired(item):
+                self._remove(key)
+                self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                return default
+            self.data.move_to_end(key)
+            self.stats['hits'] += 1
+            return item[0]
+
+    def put(self, key, value, ttl=None):
+        '''
+        ttl overrides default ttl of this cache.
+        Values larger than max_size are not cached.
+        '''
+        if ttl is None:
+            ttl = self.ttl
+        size = self.sizeof(value)
+        expire_time = None if ttl is None else time.time() + ttl
+        with self.lock:
+            if key in self.data:
+                self._remove(key)
+            if size > self.max_size:
+                return
+            self.data[key] = (value, size, expire_time)
+            self.size += size
+            while self.size > self.max_size:
+                oldest = next(iter(self.data))
+                self._remove(oldest)
+                self.stats['evicted'] += 1
+
+    def pop(self, key, default=None):
+        with self.lock:
+            if key not in self.data:
+                return default
+            value = self.data[key][0]
+            self._remove(key)
+            return value
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.size = 0
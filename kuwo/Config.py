@@ -38,6 +38,45 @@ LRC_DIR = os.path.join(CACHE_DIR, 'lrc')
 SONG_DB = os.path.join(CACHE_DIR, 'music.sqlite')
 # url requests are stored here.
 CACHE_DB = os.path.join(CACHE_DIR, 'cache.db')
+# used instead of CACHE_DB if leveldb is not available.
+CACHE_SQLITE = os.path.join(CACHE_DIR, 'cache.sqlite')
+# other processes use CACHE_DB through this socket.
+CACHE_SOCK = os.path.join(CACHE_DIR, 'cache.sock')
+# max size of CACHE_DB, in bytes, least recently used ones are removed.
+CACHE_DB_SIZE = 2 ** 26
+# Expire time of cached url requests, in seconds.
+_HOUR = 3600
+_DAY = 24 * _HOUR
+CACHE_TTL = {
+        'default': _DAY,
+        # node lists of TopList, Themes, Categories and Artists
+        'nodes': 6 * _HOUR,
+        # songs, albums and MVs of artists, albums and themes.
+        'lists': 3 * _DAY,
+        'artist-info': 7 * _DAY,
+        # links expire on server, they are only kept in memory.
+        'song-link': 20 * 60,
+        'radio': _HOUR,
+        # lists of big artist images used in lyrics background.
+        'image-list': 7 * _DAY,
+        }
+# max size of in-memory cache of search results and song lists, in bytes.
+REQ_CACHE_SIZE = 2 ** 24
+# expire time of in-memory cached requests, in seconds.
+REQ_CACHE_TTL = _HOUR
+# max number of parsed song lists, nodes and artist info kept in memory.
+OBJ_CACHE_NUM = 256
+# max number of resolved song links kept in memory.
+LINK_CACHE_NUM = 512
+# max size of decoded lyrics background images kept in memory, in bytes.
+BACKGROUND_CACHE_SIZE = 2 ** 25
+# large songs(ape) and mvs are downloaded with this many connections,
+# set it to 1 to disable segmented download.
+DOWNLOAD_SEGMENTS = 4
+# songs to be played later or cached use at most this many connections.
+DOWNLOAD_SEGMENTS_BACKGROUND = 2
+# max number of songs and mvs downloaded at the same time.
+DOWNLOAD_ACTIVE = 3
 # store playlists, `cached` not included.
 PLS_JSON = os.path.join(CACHE_DIR, 'pls.json')
 # store radio playlist.
@@ -57,6 +96,7 @@ _default_conf = {
         'use-ape': False,
         'use-mkv': False,
         'use-status-icon': True,
+        'cache-workers': 3,
         'lrc-img-back-color': 'rgba(0, 0, 0, 1)',
         'lrc-word-back-color': 'rgba(237, 221, 221, 0.28)',
         }
@@ -79,7 +119,10 @@ def check_first():
 def load_conf():
     if os.path.exists(_conf_file):
         with open(_conf_file) as fh:
-            return json.loads(fh.read())
+            conf = dict(_default_conf)
+            # options added in newer versions are missing in old conf.
+            conf.update(json.loads(fh.read()))
+            return conf
     dump_conf(_default_conf)
     return _default_conf
 
@@ -0,0 +1,958 @@
+
+import json
+import math
+import os
+import re
+import threading
+import time
+
+# size of each read is adapted between CHUNK and MAX_CHUNK, so that it
+# takes about CHUNK_TIME.
+CHUNK = 2 ** 14
+MAX_CHUNK = 2 ** 20
+CHUNK_TIME = 0.05
+TIMEOUT = 30
+# sidecar file is updated after receiving this size of data.
+META_INTERVAL = 2 ** 20
+# files smaller than this are always downloaded with one connection.
+SEGMENT_MIN_SIZE = 2 ** 23
+# a seek to less than this beyond received data waits for it, instead of
+# sending a new range request. It is not smaller than MAX_CHUNK, so that
+# a segment is never split inside the chunk being read.
+SEEK_GAP = 2 * MAX_CHUNK
+
+# priority classes of downloads, smaller is more urgent.
+PRIORITY_PLAYING = 0
+PRIORITY_NEXT = 1
+PRIORITY_CACHING = 2
+# bandwidth weights of priority classes which are active at the same time.
+SHARES = {
+        PRIORITY_PLAYING: 6,
+        PRIORITY_NEXT: 3,
+        PRIORITY_CACHING: 1,
+        }
+# measured peak rate decays by this factor per second.
+PEAK_DECAY = 0.95
+# progress of a download is reported at most once in this interval.
+PROGRESS_INTERVAL = 0.25
+
+_CONTENT_RANGE = re.compile(r'bytes\s+(\d+)-(\d+)/(\d+|\*)')
+
+def parse_content_range(value):
+    '''
+    Parse `Content-Range: bytes 100-199/1000`, returns (100, 199, 1000),
+    total is None if it is unknown.
+    '''
+    if not value:
+        return None
+    match = _CONTENT_RANGE.match(value.strip())
+    if not match:
+        return None
+    start, end, total = match.groups()
+    if total == '*':
+        total = None
+    else:
+        total = int(total)
+    return (int(start), int(end), total)
+
+
+def pwrite_all(fd, data, offset):
+    while data:
+        written = os.pwrite(fd, data, offset)
+        data = data[written:]
+        offset += written
+
+
+class Reader:
+    '''
+    Read response body into a reused buffer, instead of creating a new
+    bytes object for each chunk.
+    '''
+    def __init__(self):
+        self.view = memoryview(bytearray(MAX_CHUNK))
+        self.size = CHUNK
+
+    def read(self, req, limit=None):
+        '''
+        Returns a memoryview of data, which is valid until next read().
+        '''
+        size = self.size
+        if limit is not None:
+            size = min(size, limit)
+        start = time.time()
+        received = req.readinto(self.view[:size])
+        elapsed = time.time() - start
+        if received == self.size and elapsed < CHUNK_TIME / 2 and \
+                self.size < MAX_CHUNK:
+            self.size *= 2
+        elif elapsed > CHUNK_TIME * 2 and self.size > CHUNK:
+            self.size //= 2
+        return self.view[:received]
+
+
+class Segment:
+    '''
+    Byte range [start, end) of file, `pos` is the next byte to receive.
+    '''
+    def __init__(self, start, end, pos=None):
+        self.start = start
+        self.end = end
+        self.pos = start if pos is None else pos
+
+    def done(self):
+        return self.pos >= self.end
+
+    def to_list(self):
+        return [self.start, self.pos, self.end]
+
+
+class Download:
+    '''
+    Download link to filepath, which can be resumed.
+
+    Data is written to `filepath.part`, and its total length, ETag and
+    the size of data received are saved in the sidecar file
+    `filepath.part.json`. If the transfer fails, the next try (even in
+    the next session) continues with a Range request, and the part file
+    is renamed to filepath when it is completed.
+
+    If `segments` > 1 and the server accepts ranges, files larger than
+    SEGMENT_MIN_SIZE are split into segments which are fetched in
+    parallel. The head segment starts first, others start after
+    `head_size` bytes of it are received, so that the file can be
+    played as soon as possible.
+
+    If the server accepts ranges, any unreceived part of file can be
+    fetched first with seek(), and the gap before it is filled later.
+    '''
+    def __init__(self, pool, link, filepath, timeout=TIMEOUT, segments=1,
+            head_size=0, scheduler=None, priority=PRIORITY_PLAYING):
+        self.pool = pool
+        self.scheduler = scheduler
+        self.priority = priority
+        self.link = link
+        self.filepath = filepath
+        self.part_path = filepath + '.part'
+        self.meta_path = filepath + '.part.json'
+        self.timeout = timeout
+        self.max_segments = segments
+        self.head_size = head_size
+        # total length of file, 0 if unknown.
+        self.length = 0
+        self.etag = None
+        # size of data received from the beginning of file without gap.
+        self.received = 0
+        # unfinished segments sorted by start, None in sequential mode.
+        self.segments = None
+        # (segment, end) which is fetched before others, set by seek().
+        self.seek_target = None
+        # condition and thread starter of running segments.
+        self.cond = None
+        self.spawn = None
+        self.force_quit = False
+        self.stats = {
+                'requests': 0,
+                'resumed': 0,
+                'transferred': 0,
+                'segments': 0,
+                'seeks': 0,
+                }
+
+    def load_meta(self):
+        '''
+        Restore state from sidecar file of an unfinished download.
+        '''
+        if not os.path.exists(self.part_path) or \
+                not os.path.exists(self.meta_path):
+            return
+        try:
+            with open(self.meta_path) as fh:
+                meta = json.loads(fh.read())
+            self.length = meta['length']
+            self.etag = meta['etag']
+            self.received = min(meta['received'],
+                    os.path.getsize(self.part_path))
+            if meta.get('segments'):
+                self.segments = sorted((Segment(start, end, pos) for
+                        start, pos, end in meta['segments']),
+                        key=lambda seg: seg.start)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print('Error: Download.load_meta():', e)
+            self.length = 0
+            self.etag = None
+            self.received = 0
+            self.segments = None
+
+    def dump_meta(self):
+        meta = {
+                'length': self.length,
+                'etag': self.etag,
+                'received': self.received,
+                }
+        if self.segments:
+            meta['segments'] = [seg.to_list() for seg in self.segments]
+        tmp_path = self.meta_path + '.tmp'
+        with open(tmp_path, 'w') as fh:
+            fh.write(json.dumps(meta))
+        os.replace(tmp_path, self.meta_path)
+
+    def remove_meta(self):
+        if os.path.exists(self.meta_path):
+            os.remove(self.meta_path)
+
+    def open_request(self):
+        '''
+        Send request, with Range header if part of file is received.
+        If server does not accept range or file is changed, download it
+        from the beginning.
+        '''
+        headers = {}
+        if self.received > 0:
+            headers['Range'] = 'bytes={0}-'.format(self.received)
+            if self.etag:
+                headers['If-Range'] = self.etag
+        req = self.pool.urlopen(self.link, headers=headers,
+                timeout=self.timeout, bulk=True)
+        self.stats['requests'] += 1
+        content_range = parse_content_range(req.getheader('Content-Range'))
+        if req.status == 206 and content_range and \
+                content_range[0] == self.received and \
+                (not self.length or content_range[2] in (None, self.length)):
+            self.stats['resumed'] += 1
+            return req
+        if req.status == 206:
+            # unexpected range, drop it and get the whole file.
+            req.close()
+            self.received = 0
+            return self.open_request()
+        self.received = 0
+        self.length = int(req.getheader('Content-Length', 0))
+        self.etag = req.getheader('ETag')
+        return req
+
+    def starting_up(self):
+        '''
+        True if the first `head_size` bytes are not received yet.
+        '''
+        if self.length and self.received >= self.length:
+            return False
+        return self.received < self.head_size
+
+    def run(self, on_chunk=None):
+        '''
+        Download the rest of file.
+        on_chunk(received, length) is called after each chunk is written.
+        Returns True if file is completed and renamed to filepath,
+        False if it is stopped by force_quit.
+        Network errors are raised, call run() again to resume.
+        '''
+        if not self.scheduler:
+            return self._run(on_chunk)
+        if not self.scheduler.acquire(self):
+            return False
+        try:
+            return self._run(on_chunk)
+        finally:
+            self.scheduler.release(self)
+
+    def consume(self, size):
+        if self.scheduler:
+            self.scheduler.consume(self, size)
+
+    def _run(self, on_chunk):
+        if self.is_complete():
+            # stopped after the last write but before it was renamed.
+            if on_chunk:
+                on_chunk(self.received, self.length)
+            self.complete()
+            return True
+        if self.segments and self.max_segments > 1:
+            return self.run_segments(None, on_chunk)
+        if self.segments:
+            # server refused ranges of segments, go on sequentially from
+            # the end of contiguous data.
+            self.received = self.get_prefix()
+            self.segments = None
+            self.seek_target = None
+        req = self.open_request()
+        if self.can_split(req):
+            self.split()
+            return self.run_segments(req, on_chunk)
+        fd = self.open_part()
+        reader = Reader()
+        try:
+            self.dump_meta()
+            dumped = self.received
+            while True:
+                if self.force_quit:
+                    req.close()
+                    self.dump_meta()
+                    return False
+                try:
+                    chunk = reader.read(req)
+                except Exception:
+                    self.dump_meta()
+                    raise
+                if not chunk:
+                    break
+                pwrite_all(fd, chunk, self.received)
+                self.received += len(chunk)
+                self.stats['transferred'] += len(chunk)
+                self.consume(len(chunk))
+                if self.received - dumped >= META_INTERVAL:
+                    self.dump_meta()
+                    dumped = self.received
+                if on_chunk:
+                    on_chunk(self.received, self.length)
+        finally:
+            os.close(fd)
+        if self.length and self.received < self.length:
+            self.dump_meta()
+            raise ConnectionError('Download: connection closed at {0}/{1}'
+                    .format(self.received, self.length))
+        self.complete()
+        return True
+
+    def is_complete(self):
+        '''
+        True if the whole file is in part file already.
+        '''
+        if not self.length or self.received < self.length:
+            return False
+        try:
+            return os.path.getsize(self.part_path) >= self.length
+        except OSError as e:
+            return False
+
+    def complete(self):
+        '''
+        Rename part file to filepath, and remove its sidecar file.
+        '''
+        self.segments = None
+        self.seek_target = None
+        if self.length and os.path.getsize(self.part_path) > self.length:
+            os.truncate(self.part_path, self.length)
+        os.replace(self.part_path, self.filepath)
+        self.remove_meta()
+
+    def open_part(self):
+        '''
+        Open part file for positioned writes. If length of file is known,
+        disk space of the whole file is allocated at once, so that it is
+        not fragmented by segments or resumed downloads.
+        '''
+        fd = os.open(self.part_path, os.O_WRONLY | os.O_CREAT, 0o644)
+        size = os.fstat(fd).st_size
+        if not self.length:
+            os.ftruncate(fd, self.received)
+            return fd
+        if size > self.length:
+            os.ftruncate(fd, self.length)
+        elif size < self.length and hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(fd, 0, self.length)
+            except OSError as e:
+                # not supported by this file system.
+                pass
+        return fd
+
+    def can_split(self, req):
+        '''
+        Files are fetched in segments if server accepts ranges, even if
+        there is only one segment, so that it can be split by seek().
+        '''
+        if self.max_segments < 2 or not self.length or \
+                self.received >= self.length:
+            return False
+        return req.status == 206 or \
+                req.getheader('Accept-Ranges', '').lower() == 'bytes'
+
+    def split(self):
+        '''
+        Split the rest of file into segments of the same size.
+        '''
+        remain = self.length - self.received
+        if self.length < SEGMENT_MIN_SIZE:
+            num = 1
+        else:
+            num = min(self.max_segments,
+                    math.ceil(remain / SEGMENT_MIN_SIZE * 2))
+        size = math.ceil(remain / num)
+        self.segments = []
+        for start in range(self.received, self.length, size):
+            self.segments.append(Segment(start, min(start + size,
+                self.length)))
+        self.stats['segments'] = len(self.segments)
+
+    def get_prefix(self):
+        '''
+        Get the size of data received from the beginning without gap.
+        '''
+        prefix = self.received
+        for seg in self.segments:
+            if seg.start > prefix:
+                break
+            prefix = max(prefix, seg.pos)
+            if not seg.done():
+                break
+        return prefix
+
+    def is_available(self, offset, size):
+        '''
+        True if `size` bytes from offset (or to the end of file) are
+        received. Data out of unfinished segments are all received.
+        '''
+        segments = self.segments
+        if not segments:
+            if self.length and self.received >= self.length:
+                return True
+            return self.received >= offset + size
+        end = offset + size
+        if self.length:
+            end = min(end, self.length)
+        for seg in list(segments):
+            if seg.pos < end and offset < seg.end and not seg.done():
+                return False
+        return True
+
+    def seek(self, offset, size):
+        '''
+        Fetch `size` bytes from offset before other unreceived data.
+        If offset is far beyond received data of its segment, that segment
+        is split at offset and the new one is fetched at once, while other
+        segments are paused until it gets `size` bytes.
+        Returns True if a new range request is started.
+        '''
+        cond = self.cond
+        if cond is None:
+            return False
+        with cond:
+            if self.spawn is None:
+                return False
+            for seg in self.segments:
+                if seg.pos <= offset < seg.end:
+                    break
+            else:
+                # already received.
+                return False
+            if offset - seg.pos < SEEK_GAP:
+                self.seek_target = (seg, offset + size)
+                cond.notify_all()
+                return False
+            new_seg = Segment(offset, seg.end)
+            seg.end = offset
+            self.segments.append(new_seg)
+            self.segments.sort(key=lambda seg: seg.start)
+            self.seek_target = (new_seg, offset + size)
+            self.stats['seeks'] += 1
+            self.spawn(new_seg)
+            cond.notify_all()
+        return True
+
+    def is_target(self, seg):
+        return self.seek_target is not None and self.seek_target[0] is seg
+
+    def is_blocked(self, seg):
+        '''
+        True if seg waits for the segment of seek target.
+        '''
+        if self.seek_target is None:
+            return False
+        target, end = self.seek_target
+        if target is seg or target.done() or target.pos >= end:
+            return False
+        return True
+
+    def open_segment(self, seg):
+        headers = {'Range': 'bytes={0}-{1}'.format(seg.pos, seg.end - 1)}
+        if self.etag:
+            headers['If-Range'] = self.etag
+        req = self.pool.urlopen(self.link, headers=headers,
+                timeout=self.timeout, bulk=True)
+        self.stats['requests'] += 1
+        content_range = parse_content_range(req.getheader('Content-Range'))
+        if req.status != 206 or not content_range or \
+                content_range[0] != seg.pos or \
+                content_range[1] != seg.end - 1:
+            req.close()
+            # fall back to sequential mode in next run().
+            self.max_segments = 1
+            raise ConnectionError('Download: range request refused')
+        return req
+
+    def run_segments(self, req, on_chunk):
+        '''
+        Fetch segments in worker threads, and wait for them here.
+        `req` is the opened response of the head segment, if any.
+        '''
+        cond = threading.Condition()
+        head_ready = threading.Event()
+        state = {'stop': False, 'error': None}
+        self.received = self.get_prefix()
+        if self.received - self.segments[0].start >= self.head_size:
+            head_ready.set()
+
+        def fetch(seg, req, is_head):
+            try:
+                if not is_head and not self.is_target(seg):
+                    head_ready.wait()
+                if state['stop'] or seg.done():
+                    return
+                if req is None:
+                    req = self.open_segment(seg)
+                reader = Reader()
+                while not seg.done():
+                    with cond:
+                        while not state['stop'] and self.is_blocked(seg):
+                            cond.wait(0.5)
+                    if state['stop']:
+                        return
+                    chunk = reader.read(req, seg.end - seg.pos)
+                    if not chunk:
+                        raise ConnectionError(
+                                'Download: segment closed at {0}/{1}'
+                                .format(seg.pos, seg.end))
+                    pwrite_all(fd, chunk, seg.pos)
+                    with cond:
+                        seg.pos += len(chunk)
+                        self.stats['transferred'] += len(chunk)
+                        cond.notify_all()
+                    self.consume(len(chunk))
+                    if is_head and seg.pos - seg.start >= self.head_size:
+                        head_ready.set()
+            except Exception as e:
+                with cond:
+                    if state['error'] is None:
+                        state['error'] = e
+                    cond.notify_all()
+            finally:
+                if is_head:
+                    head_ready.set()
+                if req is not None:
+                    req.close()
+
+        def is_running():
+            return not self.force_quit and state['error'] is None and \
+                    not all(seg.done() for seg in self.segments)
+
+        def spawn(seg, req=None, is_head=False):
+            thread = threading.Thread(target=fetch, args=(seg, req, is_head))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        pending = [seg for seg in self.segments if not seg.done()]
+        fd = self.open_part()
+        threads = []
+        try:
+            with cond:
+                for seg in pending:
+                    if seg is pending[0]:
+                        spawn(seg, req, True)
+                    else:
+                        spawn(seg)
+                self.cond = cond
+                self.spawn = spawn
+            self.dump_meta()
+            dumped = self.stats['transferred']
+            while is_running():
+                with cond:
+                    if is_running():
+                        cond.wait(1)
+                    received = self.get_prefix()
+                    transferred = self.stats['transferred']
+                if transferred - dumped >= META_INTERVAL:
+                    self.dump_meta()
+                    dumped = transferred
+                if received != self.received:
+                    self.received = received
+                    if on_chunk:
+                        on_chunk(self.received, self.length)
+        finally:
+            with cond:
+                state['stop'] = True
+                self.spawn = None
+                cond.notify_all()
+            head_ready.set()
+            for thread in threads:
+                thread.join()
+            os.close(fd)
+            self.cond = None
+        self.received = self.get_prefix()
+        self.dump_meta()
+        if state['error']:
+            raise state['error']
+        if self.force_quit:
+            return False
+        if on_chunk:
+            on_chunk(self.received, self.length)
+        self.complete()
+        return True
+
+
+class Scheduler:
+    '''
+    Coordinate downloads of player, prefetching and caching daemon.
+
+    At most `max_active` downloads run at the same time, others wait in
+    order of priority. A PRIORITY_PLAYING download is never queued; if
+    the limit is exceeded, the least urgent active downloads are paused.
+    While a download is starting up, all less urgent ones are paused.
+    When more than one priority class is active, each class gets its
+    share of the measured peak rate, in proportion to `shares`.
+    '''
+    def __init__(self, max_active=3, shares=SHARES):
+        self.max_active = max_active
+        self.shares = shares
+        self.cond = threading.Condition()
+        self.active = []
+        self.waiting = []
+        self.seq = 0
+        self.peak_rate = 0
+        self.window_start = time.time()
+        self.window_bytes = 0
+        self.class_bytes = {}
+        self.stats = {
+                'queued': 0,
+                'paused': 0,
+                'throttled': 0,
+                }
+
+    def rank(self, download):
+        '''
+        Downloads of the same priority run in order, except that a newer
+        PRIORITY_PLAYING one goes first, it is what the user waits for.
+        '''
+        if download.priority == PRIORITY_PLAYING:
+            return (download.priority, -download.seq)
+        return (download.priority, download.seq)
+
+    def acquire(self, download):
+        '''
+        Wait until download is allowed to start.
+        Returns False if it is stopped by force_quit while waiting.
+        '''
+        with self.cond:
+            self.seq += 1
+            download.seq = self.seq
+            if download.priority != PRIORITY_PLAYING:
+                self.waiting.append(download)
+                if len(self.active) >= self.max_active:
+                    self.stats['queued'] += 1
+                # it may be raised to PRIORITY_PLAYING while waiting.
+                while not download.force_quit and \
+                        download.priority != PRIORITY_PLAYING and \
+                        (len(self.active) >= self.max_active or
+                        min(self.waiting, key=self.rank) is not download):
+                    self.cond.wait(1)
+                self.waiting.remove(download)
+                if download.force_quit:
+                    self.cond.notify_all()
+                    return False
+            self.active.append(download)
+            self.cond.notify_all()
+            return True
+
+    def release(self, download):
+        with self.cond:
+            if download in self.active:
+                self.active.remove(download)
+            self.cond.notify_all()
+
+    def wake_up(self):
+        '''
+        Priority of a download is changed, check waiting ones again.
+        '''
+        with self.cond:
+            self.cond.notify_all()
+
+    def should_pause(self, download):
+        ranked = sorted(self.active, key=self.rank)
+        if download in ranked[self.max_active:]:
+            return True
+        for other in self.active:
+            if other.priority < download.priority and other.starting_up():
+                return True
+        return False
+
+    def consume(self, download, size):
+        '''
+        Called after each chunk is received, blocks while download
+        is paused or is faster than its share.
+        '''
+        delay = 0
+        with self.cond:
+            self.account(download, size)
+            if self.should_pause(download):
+                self.stats['paused'] += 1
+                while not download.force_quit and \
+                        self.should_pause(download):
+                    self.cond.wait(0.5)
+            elif not download.starting_up():
+                delay = self.get_delay(download)
+            if download.received - size < download.head_size <= \
+                    download.received:
+                # start up finished, wake up paused downloads.
+                self.cond.notify_all()
+        if delay > 0:
+            self.stats['throttled'] += 1
+            time.sleep(delay)
+
+    def account(self, download, size):
+        now = time.time()
+        elapsed = now - self.window_start
+        if elapsed >= 1:
+            rate = self.window_bytes / elapsed
+            self.peak_rate = max(rate, self.peak_rate * PEAK_DECAY ** elapsed)
+            self.window_start = now
+            self.window_bytes = 0
+            self.class_bytes.clear()
+        self.window_bytes += size
+        self.class_bytes[download.priority] = \
+                self.class_bytes.get(download.priority, 0) + size
+
+    def get_delay(self, download):
+        classes = set(other.priority for other in self.active)
+        if len(classes) < 2 or not self.peak_rate:
+            return 0
+        total = sum(self.shares[priority] for priority in classes)
+        allowed = self.peak_rate * self.shares[download.priority] / total
+        elapsed = time.time() - self.window_start
+        # priority may be changed after its last chunk was accounted.
+        excess = self.class_bytes.get(download.priority, 0) - \
+                allowed * elapsed
+        if excess <= 0:
+            return 0
+        return min(excess / allowed, 1)
+
+
+class Transfer:
+    '''
+    A download shared by all listeners which want the same file.
+
+    Listeners are GObjects with `chunk-received`, `can-play` and
+    `downloaded` signals. Signals emitted by the owner are recorded, so
+    that a listener attached later gets the current state at once.
+    The download is stopped only when all listeners are detached.
+    Its priority is the most urgent one of current listeners.
+    '''
+    def __init__(self, key, priority):
+        self.key = key
+        self.priority = priority
+        self.download = None
+        # MediaInfo.Buffering of the download, if any.
+        self.buffering = None
+        self.cancelled = False
+        self.listeners = []
+        # listener -> priority
+        self.priorities = {}
+        self.signals = {}
+        self.lock = threading.RLock()
+
+    def set_download(self, download, buffering=None):
+        with self.lock:
+            self.download = download
+            self.buffering = buffering
+            download.priority = self.priority
+            download.force_quit = self.cancelled
+
+    def update_priority(self):
+        '''
+        Reset priority of the download after listeners are changed.
+        '''
+        with self.lock:
+            if self.priorities:
+                self.priority = min(self.priorities.values())
+            download = self.download
+            if download:
+                download.priority = self.priority
+        if download and download.scheduler:
+            download.scheduler.wake_up()
+
+    def attach(self, listener, priority):
+        '''
+        If the download is cancelled but its owner is still running, it
+        goes on for the new listener.
+        Call update_priority() then.
+        '''
+        with self.lock:
+            self.listeners.append(listener)
+            self.priorities[listener] = priority
+            if self.cancelled:
+                self.cancelled = False
+                if self.download:
+                    self.download.force_quit = False
+            for name in ('chunk-received', 'can-play', 'downloaded'):
+                if name in self.signals:
+                    listener.emit(name, self.signals[name])
+
+    def detach(self, listener):
+        with self.lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+            self.priorities.pop(listener, None)
+            if not self.listeners:
+                self.cancelled = True
+                if self.download:
+                    self.download.force_quit = True
+        self.update_priority()
+
+    def emitted(self, name):
+        return name in self.signals
+
+    def emit(self, name, value):
+        with self.lock:
+            self.signals[name] = value
+            for listener in list(self.listeners):
+                listener.emit(name, value)
+
+
+class Registry:
+    '''
+    In-flight downloads keyed by target path, so that a file is never
+    downloaded twice at the same time.
+    '''
+    def __init__(self):
+        self.transfers = {}
+        self.lock = threading.Lock()
+        self.stats = {
+                'started': 0,
+                'attached': 0,
+                }
+
+    def join(self, key, listener, priority=PRIORITY_PLAYING):
+        '''
+        Returns (transfer, is_owner), the owner shall download the file
+        and emit signals through transfer, then call leave().
+        Others get signals of that transfer.
+        '''
+        with self.lock:
+            transfer = self.transfers.get(key)
+            if transfer is None:
+                transfer = Transfer(key, priority)
+                transfer.attach(listener, priority)
+                self.transfers[key] = transfer
+                self.stats['started'] += 1
+                return (transfer, True)
+            self.stats['attached'] += 1
+            # attach before the owner leaves, to reuse its download.
+            transfer.attach(listener, priority)
+        transfer.update_priority()
+        return (transfer, False)
+
+    def leave(self, transfer, stopped=False):
+        '''
+        Called by the owner when it finishes. If its download is
+        `stopped` by cancelling, but a new listener is attached since,
+        transfer is kept and False is returned, the owner shall resume
+        downloading. A cancelled transfer stays here until its owner
+        leaves, so that two downloads never write the same part file.
+        '''
+        with self.lock:
+            with transfer.lock:
+                if stopped and not transfer.cancelled:
+                    return False
+            if self.transfers.get(transfer.key) is transfer:
+                del self.transfers[transfer.key]
+            return True
+
+
+class Progress:
+    '''
+    Progress of running downloads, keyed by target path.
+
+    update() is called by download threads after each chunk, but a new
+    value is published only if its percent has changed, and at most once
+    per `interval` for each download, except the last one.
+    Observers are called with a dict of published entries
+    {key: (received, length)} in one batch, through `schedule(func,
+    delay)`, so that a view does not wake up main loop for every chunk.
+    A finished download is published with received = None.
+    Nothing is scheduled while there is no observer.
+    '''
+    def __init__(self, schedule, interval=PROGRESS_INTERVAL):
+        self.schedule = schedule
+        self.interval = interval
+        # key -> [received, length, percent, last published time]
+        self.entries = {}
+        self.pending = {}
+        self.observers = []
+        self.scheduled = False
+        self.last_flush = 0
+        self.lock = threading.Lock()
+        self.stats = {
+                'updates': 0,
+                'published': 0,
+                'flushes': 0,
+                }
+
+    def add_observer(self, observer):
+        self.observers.append(observer)
+
+    def remove_observer(self, observer):
+        if observer in self.observers:
+            self.observers.remove(observer)
+
+    def get(self, key):
+        '''
+        Returns (received, length) of a running download, or None.
+        '''
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            return (entry[0], entry[1])
+
+    def update(self, key, received, length):
+        '''
+        Returns percent if this value is published, or None.
+        '''
+        now = time.time()
+        if length:
+            percent = int(received / length * 100)
+        else:
+            percent = 0
+        with self.lock:
+            self.stats['updates'] += 1
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = [0, 0, -1, 0]
+                self.entries[key] = entry
+            entry[0] = received
+            entry[1] = length
+            if percent == entry[2]:
+                return None
+            if now - entry[3] < self.interval and \
+                    (not length or received < length):
+                return None
+            entry[2] = percent
+            entry[3] = now
+            self.publish(key, (received, length), now)
+            return percent
+
+    def finish(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.publish(key, (None, 0), time.time())
+
+    def publish(self, key, value, now):
+        self.stats['published'] += 1
+        if not self.observers:
+            return
+        self.pending[key] = value
+        if self.scheduled:
+            return
+        self.scheduled = True
+        delay = max(0, self.interval - (now - self.last_flush))
+        self.schedule(self.flush, delay)
+
+    def flush(self):
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+            self.scheduled = False
+            self.last_flush = time.time()
+            self.stats['flushes'] += 1
+        for observer in list(self.observers):
+            observer(pending)
+        return False
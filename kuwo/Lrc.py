@@ -50,6 +50,8 @@ class Lrc(Gtk.Box):
         self.lrc_default_background = os.path.join(Config.THEME_DIR,
                 'lrc-background.jpg')
         self.lrc_background = None
+        # ((background, width, height), scaled pixbuf)
+        self.lrc_background_scaled = None
 
         # lyrics window
         self.lrc_window = Gtk.ScrolledWindow()
@@ -97,6 +99,17 @@ class Lrc(Gtk.Box):
         self.lrc_buf.set_text('\n'.join(self.lrc_content))
         self.sync_lrc(0)
 
+    def get_next_time(self, timestamp):
+        '''
+        Get time of the next line of lyrics after timestamp, or None.
+        '''
+        if self.lrc_obj is None:
+            return None
+        for tag, content in self.lrc_obj[self.old_line+1:]:
+            if tag > timestamp:
+                return tag
+        return None
+
     def sync_lrc(self, timestamp):
         if self.lrc_obj is None:
             return
@@ -118,11 +131,32 @@ class Lrc(Gtk.Box):
         self.old_line_iter = (iter_start, iter_end)
         self.old_line = line_num
 
-    def update_background(self, filepath, error=None):
-        if filepath and os.path.exists(filepath):
-            self.lrc_background = filepath
+    def update_background(self, pix):
+        '''
+        pix is a decoded Pixbuf, or None to use the default background.
+        '''
+        self.lrc_background = pix
+
+    def get_background(self, width, height):
+        '''
+        Get background image scaled to fit lrc view, it is only scaled
+        again when the image or the size is changed.
+        '''
+        key = (self.lrc_background, width, height)
+        if self.lrc_background_scaled and \
+                self.lrc_background_scaled[0] == key:
+            return self.lrc_background_scaled[1]
+        if self.lrc_background:
+            pix = self.lrc_background
+            ratio = min(width / pix.get_width(), height / pix.get_height())
+            pix = pix.scale_simple(max(int(pix.get_width() * ratio), 1),
+                    max(int(pix.get_height() * ratio), 1),
+                    GdkPixbuf.InterpType.BILINEAR)
         else:
-            self.lrc_background = None
+            pix = GdkPixbuf.Pixbuf.new_from_file_at_size(
+                    self.lrc_default_background, width, height)
+        self.lrc_background_scaled = (key, pix)
+        return pix
 
     def on_lrc_tv_draw(self, textview, cr):
         # TODO: use Gtk.Image to display background image
@@ -146,12 +180,7 @@ class Lrc(Gtk.Box):
         cr.rectangle(0, 0, tv_width, tv_height)
         cr.fill()
 
-        if self.lrc_background:
-            pix = GdkPixbuf.Pixbuf.new_from_file_at_size(
-                    self.lrc_background, tv_width, tv_height)
-        else:
-            pix = GdkPixbuf.Pixbuf.new_from_file_at_size(
-                    self.lrc_default_background, tv_width, tv_height)
+        pix = self.get_background(tv_width, tv_height)
         Gdk.Window.process_all_updates()
         pix_width = pix.get_width()
         pix_height = pix.get_height()
@@ -61,6 +61,7 @@ class MV(Gtk.Box):
         if not nodes_wrap:
             return
         nodes = nodes_wrap['child']
+        Net.cancel_tasks(self.liststore_nodes)
         self.liststore_nodes.clear()
         i = 0
         for node in nodes:
@@ -99,6 +100,7 @@ class MV(Gtk.Box):
 
         if init:
             self.songs_page = 0
+            Net.cancel_tasks(self.liststore_songs)
             self.liststore_songs.clear()
         Net.async_call(Net.get_mv_songs, _append_songs, 
                 self.curr_node_id, self.songs_page)
@@ -0,0 +1,278 @@
+
+import bisect
+import os
+import struct
+import time
+
+try:
+    from mutagenx.monkeysaudio import MonkeysAudioInfo
+    from mutagenx.mp3 import MPEGInfo
+    from mutagenx.mp4 import Atoms
+    from mutagenx.mp4 import MP4Info
+    mutagenx_imported = True
+except ImportError as e:
+    print('Warning: mutagenx was not found, bitrate is not detected')
+    mutagenx_imported = False
+
+# header is parsed after receiving this size of data, then after twice
+# of it, until HEAD_MAX_SIZE.
+HEAD_MIN_SIZE = 2 ** 16
+HEAD_MAX_SIZE = 2 ** 21
+# at least this long of audio is buffered before playing.
+MIN_BUFFER_TIME = 3
+# download rate is measured for at least this long.
+MIN_MEASURE_TIME = 0.5
+# the estimated size to buffer is increased by this factor.
+SAFETY = 1.2
+
+
+class PartialFile:
+    '''
+    File-like object of the head of a file, which reports the size of
+    the whole file, so that mutagenx calculates duration of the whole
+    file instead of the received part.
+    '''
+    def __init__(self, data, size):
+        self.data = data
+        self.size = size
+        self.pos = 0
+
+    def seek(self, offset, whence=0):
+        if whence == 0:
+            self.pos = offset
+        elif whence == 1:
+            self.pos += offset
+        else:
+            self.pos = self.size + offset
+
+    def tell(self):
+        return self.pos
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            chunk = self.data[self.pos:]
+        else:
+            chunk = self.data[self.pos:self.pos+size]
+        self.pos += len(chunk)
+        return chunk
+
+
+class MediaInfo:
+    '''
+    Duration and size of a song or mv, read from its header.
+    `length` is in seconds, `size` in bytes, audio data starts at `start`.
+    `toc` is a list of (seconds, offset) sorted by time, read from VBR
+    header of mp3, offsets between them are interpolated. Without it,
+    bitrate is regarded as constant.
+    '''
+    def __init__(self, length, size, start=0, toc=None):
+        self.length = length
+        self.size = size
+        self.start = start
+        if not toc:
+            toc = [(0, start), (length, size)]
+        self.toc = toc
+        self.toc_times = [seconds for seconds, offset in toc]
+
+    def byte_rate(self):
+        '''
+        Average bytes per second of playing.
+        '''
+        return self.size / self.length
+
+    def get_offset(self, seconds):
+        '''
+        Estimate byte offset of the position `seconds` in file.
+        '''
+        seconds = min(max(seconds, 0), self.length)
+        i = bisect.bisect_right(self.toc_times, seconds) - 1
+        i = min(max(i, 0), len(self.toc) - 2)
+        time0, offset0 = self.toc[i]
+        time1, offset1 = self.toc[i+1]
+        if time1 <= time0:
+            return int(offset0)
+        offset = offset0 + (offset1 - offset0) * (seconds - time0) / \
+                (time1 - time0)
+        return int(min(offset, self.size))
+
+
+def get_id3_size(data):
+    '''
+    Size of ID3v2 tag at the head of mp3 file, 0 if there is none.
+    '''
+    if len(data) < 10 or data[:3] != b'ID3':
+        return 0
+    size = 0
+    for byte in data[6:10]:
+        size = (size << 7) | (byte & 0x7f)
+    return size + 10
+
+def find_frame(data, start):
+    '''
+    Find the first mpeg frame from `start`, returns its offset or -1.
+    '''
+    pos = data.find(b'\xff', start)
+    while 0 <= pos < len(data) - 1:
+        if data[pos+1] & 0xe0 == 0xe0:
+            return pos
+        pos = data.find(b'\xff', pos + 1)
+    return -1
+
+def parse_mp3_toc(data, start, length, size):
+    '''
+    Read seek table from Xing (or Info) and VBRI header in the first
+    frame of mp3. Returns a list of (seconds, offset), or None.
+    '''
+    frame = find_frame(data, start)
+    if frame < 0:
+        return None
+    head = data[frame:frame+64]
+    xing = head.find(b'Xing')
+    if xing < 0:
+        xing = head.find(b'Info')
+    if xing >= 0:
+        pos = frame + xing + 4
+        flags, = struct.unpack('>I', data[pos:pos+4])
+        pos += 4
+        if flags & 0x1:
+            pos += 4
+        stream_size = size - frame
+        if flags & 0x2:
+            stream_size, = struct.unpack('>I', data[pos:pos+4])
+            pos += 4
+        if not flags & 0x4 or len(data) < pos + 100:
+            return None
+        toc = [(length * i / 100, frame + data[pos+i] * stream_size / 256)
+                for i in range(100)]
+        toc.append((length, min(frame + stream_size, size)))
+        return toc
+    # VBRI header is always 32 bytes after frame header.
+    pos = frame + 36
+    if data[pos:pos+4] != b'VBRI':
+        return None
+    entries, scale, entry_size = struct.unpack('>HHH', data[pos+18:pos+24])
+    table = data[pos+26:pos+26+entries*entry_size]
+    if not entries or entry_size not in (1, 2, 3, 4) or \
+            len(table) < entries * entry_size:
+        return None
+    toc = [(0, frame)]
+    offset = frame
+    for i in range(entries):
+        entry = table[i*entry_size:(i+1)*entry_size]
+        offset += int.from_bytes(entry, 'big') * scale
+        toc.append((length * (i + 1) / entries, min(offset, size)))
+    return toc
+
+def get_mdat_offset(atoms):
+    for atom in atoms.atoms:
+        if atom.name == b'mdat':
+            return atom.offset + 8
+    return 0
+
+
+def parse_head(data, size, ext):
+    '''
+    Parse the head of a file, which has `size` bytes in total.
+    ext is the file extension, like '.mp3'.
+    Returns a MediaInfo object, or None if the header is not complete
+    or not supported.
+    '''
+    if not mutagenx_imported or not size:
+        return None
+    fileobj = PartialFile(data, size)
+    start = 0
+    toc = None
+    try:
+        if ext == '.ape':
+            info = MonkeysAudioInfo(fileobj)
+        elif ext in ('.mp4', '.m4a', '.aac'):
+            atoms = Atoms(fileobj)
+            info = MP4Info(atoms, fileobj)
+            start = get_mdat_offset(atoms)
+        elif ext == '.mp3':
+            info = MPEGInfo(fileobj)
+            start = get_id3_size(data)
+            if info.length:
+                toc = parse_mp3_toc(data, start, info.length, size)
+        else:
+            return None
+    except Exception as e:
+        return None
+    if not info.length:
+        return None
+    return MediaInfo(info.length, size, min(start, size), toc)
+
+def parse_file(filepath, size, head_size=HEAD_MAX_SIZE):
+    '''
+    Parse the head of a partial file, which will have `size` bytes.
+    '''
+    try:
+        with open(filepath, 'rb') as fh:
+            data = fh.read(head_size)
+    except OSError as e:
+        return None
+    root, ext = os.path.splitext(filepath)
+    if ext == '.part':
+        ext = os.path.splitext(root)[1]
+    return parse_head(data, size, ext.lower())
+
+
+class Buffering:
+    '''
+    Decide when a partial file can be played without underrun.
+
+    The measured download rate is compared with the average byte rate of
+    playing, which is read from the file header. If downloading is faster
+    than playing, only MIN_BUFFER_TIME of audio is buffered. Otherwise
+    enough data is buffered so that the rest is downloaded before it is
+    played.
+    If header is not available, the file can be played after
+    `fallback_size` bytes or `fallback_percent` of it are received.
+    '''
+    def __init__(self, filepath, fallback_size, fallback_percent):
+        self.filepath = filepath
+        self.fallback_size = fallback_size
+        self.fallback_percent = fallback_percent
+        self.started = time.time()
+        self.start_size = None
+        self.next_parse = HEAD_MIN_SIZE
+        self.info = None
+        # time spent before can_play() returns True.
+        self.wait_time = None
+
+    def can_play(self, received, length):
+        if self.wait_time is not None:
+            return True
+        if self.start_size is None:
+            self.start_size = received
+        if self.check(received, length):
+            self.wait_time = time.time() - self.started
+            return True
+        return False
+
+    def check(self, received, length):
+        if length and received >= length:
+            return True
+        if self.info is None and length and \
+                self.next_parse <= received and \
+                self.next_parse <= HEAD_MAX_SIZE:
+            self.next_parse = received * 2
+            self.info = parse_file(self.filepath, length, received)
+        if self.info is None:
+            if length:
+                percent = received / length * 100
+            else:
+                percent = 0
+            return received > self.fallback_size or \
+                    percent > self.fallback_percent
+
+        elapsed = time.time() - self.started
+        if elapsed < MIN_MEASURE_TIME:
+            return False
+        rate = (received - self.start_size) / elapsed
+        byte_rate = self.info.byte_rate()
+        needed = byte_rate * MIN_BUFFER_TIME
+        if rate < byte_rate:
+            # data played before the rest is downloaded.
+            needed = max(needed, length * (1 - rate / byte_rate) * SAFETY)
+        return received >= min(needed, length)
@@ -3,29 +3,23 @@ from gi.repository import GdkPixbuf
 from gi.repository import GObject
 from gi.repository import Gtk
 import hashlib
+import heapq
+import http.client
 import json
 import math
 import os
-import sys
+import random
 import threading
+import time
 import urllib.error
 from urllib import parse
 from urllib import request
 
+from kuwo import Cache
 from kuwo import Config
+from kuwo import Download
+from kuwo import MediaInfo
 from kuwo import Utils
-try:
-    # Debian: http://code.google.com/p/py-leveldb/
-    from leveldb import LevelDB
-    leveldb_imported = True
-except ImportError as e:
-    try:
-        # Fedora: https://github.com/wbolster/plyvel
-        from plyvel import DB as LevelDB
-        leveldb_imported = True
-    except ImportError as e:
-        leveldb_imported = False
-        print('Warning: No leveldb/plyvel module was found, http requests will not be cached!')
 
 IMG_CDN = 'http://img4.kwcdn.kuwo.cn/'
 ARTIST = 'http://artistlistinfo.kuwo.cn/mb.slist?'
@@ -39,44 +33,578 @@ CHUNK_TO_PLAY = 2 ** 21     # 2M
 CHUNK_APE_TO_PLAY = 2 ** 23  # 8M
 CHUNK_MV_TO_PLAY = 2 ** 23  # 8M
 MAXTIMES = 3
+MAX_REDIRECTS = 5
 TIMEOUT = 30
+# timeout of each try in urlopen(), and max time of all its retries.
+REQ_TIMEOUT = 10
+REQ_DEADLINE = 20
+# urls failed or returned nothing are not requested again in this time.
+NEG_CACHE_TTL = 60
+# number of songs whose links are resolved in one prefetch task.
+LINK_BATCH = 5
+# after seeking to data not received yet, this long of it is fetched
+# before other parts of file.
+SEEK_BUFFER_TIME = 5
 SONG_NUM = 100
 ICON_NUM = 50
 
-# Using weak reference to cache song list in TopList and Radio.
-class Dict(dict):
-    pass
-req_cache = Dict()
+# Urls which failed recently.
+neg_cache = Cache.LRUCache(1024, ttl=NEG_CACHE_TTL, sizeof=lambda v: 1)
 
-# Using leveldb to cache urlrequest
-ldb = None
-if leveldb_imported:
-    #ldb = LevelDB(Config.CACHE_DB, create_if_missing=True)
-    try:
-        ldb = LevelDB(Config.CACHE_DB, create_if_missing=True)
-    except Exception as e:
-        print(e, type(e))
-        print('Warning: Only one process can run at a time, quit!')
-        sys.exit(1)
+# Cache song lists of TopList, Themes and search results in memory.
+req_cache = Cache.LRUCache(Config.REQ_CACHE_SIZE, ttl=Config.REQ_CACHE_TTL)
+
+# Parsed results of urlopen_obj(), keyed by the same key in ldb.
+# Results are shared by callers, do not modify them.
+obj_cache = Cache.LRUCache(Config.OBJ_CACHE_NUM, sizeof=lambda obj: 1)
+
+# Using leveldb (or sqlite3) to cache urlrequest
+ldb = Cache.RequestCache(
+        Cache.open_backend(Config.CACHE_DB, Config.CACHE_SQLITE,
+            Config.CACHE_SOCK),
+        Config.CACHE_DB_SIZE, Config.CACHE_TTL)
+ldb.add_listener(obj_cache.pop)
+# The process owns the database is responsible for eviction.
+if not isinstance(ldb.backend, Cache.BrokerBackend):
+    ldb.start_evict_daemon()
 
 def empty_func(*args, **kwds):
     pass
 
-# calls f on another thread
-def async_call(func, func_done, *args):
-    def do_call(*args):
+
+class PoolTimeout(TimeoutError):
+    '''
+    Raised by HTTPPool when no local connection is free in time, host of
+    the request is not to blame.
+    '''
+    pass
+
+
+class PooledResponse:
+    '''
+    Wrap http.client.HTTPResponse, so that its connection is put back to
+    HTTPPool when the body has been read completely.
+    '''
+    def __init__(self, pool, host_key, conn, resp, url, bulk=False):
+        self.pool = pool
+        self.host_key = host_key
+        self.bulk = bulk
+        self.conn = conn
+        self.resp = resp
+        self.url = url
+        self.status = resp.status
+        self.reason = resp.reason
+        self.headers = resp.headers
+
+    def getheader(self, name, default=None):
+        return self.resp.getheader(name, default)
+
+    def read(self, amt=None):
+        try:
+            chunk = self.resp.read(amt)
+        except Exception:
+            self.close()
+            raise
+        if self.resp.isclosed():
+            self.close()
+        return chunk
+
+    def readinto(self, buf):
+        try:
+            size = self.resp.readinto(buf)
+        except Exception:
+            self.close()
+            raise
+        if self.resp.isclosed():
+            self.close()
+        return size
+
+    def close(self):
+        '''
+        If the whole body is received and server does not ask to close the
+        connection, it is kept alive for the next request to this host.
+        Otherwise the connection is dropped.
+        '''
+        if self.conn is None:
+            return
+        conn = self.conn
+        self.conn = None
+        reusable = self.resp.isclosed() and not self.resp.will_close
+        if not reusable:
+            self.resp.close()
+        self.pool.release(self.host_key, conn, reusable, self.bulk)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+
+class HTTPPool:
+    '''
+    Keep persistent HTTP/1.1 connections to kuwo servers.
+
+    Most requests are sent to a few hosts, so connections are reused
+    instead of doing a new TCP handshake for each of them.
+    At most `max_idle` idle connections are kept for each host, and at
+    most `max_total` connections (idle and in use) are opened at the same
+    time; callers wait for a free slot when this limit is reached.
+    Bulk requests (songs and mvs) use at most `max_total - reserved`
+    connections, so that requests of lyrics, lists and images are not
+    blocked by long downloads.
+    '''
+    def __init__(self, max_idle=4, max_total=16, reserved=4,
+            timeout=TIMEOUT):
+        self.max_idle = max_idle
+        self.max_total = max_total
+        self.max_bulk = max_total - reserved
+        # bulk connections in use.
+        self.bulk = 0
+        self.timeout = timeout
+        # (scheme, netloc) -> [HTTPConnection, ...]
+        self.idle = {}
+        self.total = 0
+        self.cond = threading.Condition()
+        self.stats = {
+                'requests': 0,
+                'connections': 0,
+                'reused': 0,
+                }
+        self.user_agent = 'Python-urllib/' + request.__version__
+
+    def _pop_idle_conn(self):
+        # Drop the idle connection of another host to free its slot.
+        for conns in self.idle.values():
+            if conns:
+                return conns.pop(0)
+        return None
+
+    def acquire(self, host_key, timeout, bulk=False):
+        '''
+        Get a connection to host, wait at most `timeout` seconds for a
+        free slot, or else PoolTimeout is raised.
+        '''
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
+        with self.cond:
+            while True:
+                if bulk and self.bulk >= self.max_bulk:
+                    conns = None
+                else:
+                    conns = self.idle.get(host_key)
+                if conns:
+                    self.stats['reused'] += 1
+                    conn = conns.pop()
+                    conn.timeout = timeout
+                    if conn.sock:
+                        conn.sock.settimeout(timeout)
+                    if bulk:
+                        self.bulk += 1
+                    return (conn, True)
+                if not bulk or self.bulk < self.max_bulk:
+                    if self.total < self.max_total:
+                        self.total += 1
+                        break
+                    victim = self._pop_idle_conn()
+                    if victim is not None:
+                        victim.close()
+                        break
+                if deadline is None:
+                    self.cond.wait()
+                    continue
+                remain = deadline - time.time()
+                if remain <= 0:
+                    raise PoolTimeout(
+                            'HTTPPool: no free connection in {0:.1f}s'.format(
+                            timeout))
+                self.cond.wait(remain)
+            self.stats['connections'] += 1
+            if bulk:
+                self.bulk += 1
+        scheme, netloc = host_key
+        if scheme == 'https':
+            conn = http.client.HTTPSConnection(netloc, timeout=timeout)
+        else:
+            conn = http.client.HTTPConnection(netloc, timeout=timeout)
+        return (conn, False)
+
+    def release(self, host_key, conn, reusable=True, bulk=False):
+        with self.cond:
+            if bulk:
+                self.bulk -= 1
+            conns = self.idle.setdefault(host_key, [])
+            if reusable and len(conns) < self.max_idle:
+                conns.append(conn)
+            else:
+                conn.close()
+                self.total -= 1
+            self.cond.notify_all()
+
+    def clear(self):
+        with self.cond:
+            for conns in self.idle.values():
+                for conn in conns:
+                    conn.close()
+                    self.total -= 1
+            self.idle.clear()
+            self.cond.notify_all()
+
+    def _request(self, url, headers, timeout, bulk=False):
+        parts = parse.urlsplit(url)
+        host_key = (parts.scheme, parts.netloc)
+        path = parts.path or '/'
+        if parts.query:
+            path = path + '?' + parts.query
+        _headers = {
+                'User-Agent': self.user_agent,
+                'Accept-Encoding': 'identity',
+                }
+        if headers:
+            _headers.update(headers)
+        # A kept-alive connection might be closed by server already,
+        # retry once with a new connection.
+        for i in range(2):
+            conn, reused = self.acquire(host_key, timeout, bulk)
+            try:
+                conn.request('GET', path, headers=_headers)
+                resp = conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError,
+                    BrokenPipeError) as e:
+                self.release(host_key, conn, False, bulk)
+                if reused and i == 0:
+                    continue
+                raise
+            except Exception as e:
+                self.release(host_key, conn, False, bulk)
+                raise
+            with self.cond:
+                self.stats['requests'] += 1
+            return PooledResponse(self, host_key, conn, resp, url, bulk)
+
+    def urlopen(self, url, headers=None, timeout=None, bulk=False):
+        '''
+        Send a GET request, and follow redirections.
+        Set `bulk` for downloads of songs and mvs.
+        Like urllib.request.urlopen(), HTTPError is raised if server
+        returns an error status code.
+        Remember to read the whole body or close() the response, or else
+        its connection will not be released.
+        '''
+        if timeout is None:
+            timeout = self.timeout
+        for i in range(MAX_REDIRECTS):
+            resp = self._request(url, headers, timeout, bulk)
+            if resp.status in (301, 302, 303, 307, 308):
+                location = resp.getheader('Location')
+                resp.close()
+                if not location:
+                    break
+                url = parse.urljoin(url, location)
+                continue
+            if resp.status >= 400:
+                resp.close()
+                raise urllib.error.HTTPError(url, resp.status, resp.reason,
+                        resp.headers, None)
+            return resp
+        raise urllib.error.URLError('Too many redirections: ' + url)
+
+# All http requests, including songs and MVs, share this pool.
+http_pool = HTTPPool()
+
+# Priorities of tasks in executor, tasks with smaller value run first.
+PRIORITY_PLAYBACK = 0
+PRIORITY_LRC = 1
+PRIORITY_DEFAULT = 2
+PRIORITY_ICON = 3
+PRIORITY_PREFETCH = 4
+
+
+class TaskDropped(Exception):
+    '''
+    Passed to func_done() when a task is dropped because the queue of
+    executor is full.
+    '''
+    pass
+
+
+class Task:
+    def __init__(self, func, func_done, args, priority, group):
+        self.func = func
+        self.func_done = func_done
+        self.args = args
+        self.priority = priority
+        self.group = group
+        self.cancelled = False
+
+    def cancel(self):
+        '''
+        If the task is still in queue, it will never run; if it is running,
+        func_done() will not be called.
+        '''
+        self.cancelled = True
+
+    def run(self):
         result = None
         error = None
-
         try:
-            result = func(*args)
+            result = self.func(*self.args)
         except Exception as e:
             error = e
+        self.done(result, error)
 
-        GObject.idle_add(lambda: func_done(result, error))
+    def done(self, result, error=None):
+        def _on_done():
+            if not self.cancelled:
+                self.func_done(result, error)
+        if not self.cancelled:
+            GObject.idle_add(_on_done)
 
-    thread = threading.Thread(target=do_call, args=args)
+
+class Executor:
+    '''
+    A fixed number of worker threads run tasks from a bounded priority
+    queue.
+    When the queue is full, the task with lowest priority is dropped.
+    '''
+    def __init__(self, workers=6, max_queue=256):
+        self.workers = workers
+        self.max_queue = max_queue
+        # heap of (priority, seq, task)
+        self.queue = []
+        self.seq = 0
+        self.threads = []
+        self.idle_workers = 0
+        # tasks being run by workers.
+        self.running = set()
+        self.cond = threading.Condition()
+
+    def submit(self, task):
+        dropped = None
+        with self.cond:
+            self.seq += 1
+            item = (task.priority, self.seq, task)
+            if len(self.queue) >= self.max_queue:
+                worst = max(self.queue)
+                if worst[0] <= task.priority:
+                    dropped = task
+                else:
+                    self.queue.remove(worst)
+                    heapq.heapify(self.queue)
+                    dropped = worst[2]
+            if dropped is not task:
+                heapq.heappush(self.queue, item)
+                if self.idle_workers == 0 and \
+                        len(self.threads) < self.workers:
+                    thread = threading.Thread(target=self._work)
+                    thread.daemon = True
+                    self.threads.append(thread)
+                    thread.start()
+                self.cond.notify()
+        if dropped is not None:
+            dropped.done(None, TaskDropped())
+        return task
+
+    def cancel_group(self, group):
+        '''
+        Queued tasks of group are removed, so that they do not take room
+        of new tasks; running ones are cancelled too.
+        '''
+        with self.cond:
+            queue = []
+            for item in self.queue:
+                if item[2].group is group:
+                    item[2].cancel()
+                else:
+                    queue.append(item)
+            heapq.heapify(queue)
+            self.queue = queue
+            for task in self.running:
+                if task.group is group:
+                    task.cancel()
+
+    def _work(self):
+        while True:
+            with self.cond:
+                while len(self.queue) == 0:
+                    self.idle_workers += 1
+                    self.cond.wait()
+                    self.idle_workers -= 1
+                task = heapq.heappop(self.queue)[2]
+                if task.cancelled:
+                    continue
+                self.running.add(task)
+            try:
+                task.run()
+            finally:
+                with self.cond:
+                    self.running.discard(task)
+
+executor = Executor()
+
+def async_call(func, func_done, *args, priority=PRIORITY_DEFAULT,
+        group=None):
+    '''
+    Calls func(*args) in executor, and func_done(result, error) is called
+    in main thread then.
+    group is used to cancel tasks, liststore is used as group of its icons.
+    Returns a Task object which can be cancel()\'ed.
+    '''
+    task = Task(func, func_done, args, priority, group)
+    return executor.submit(task)
+
+def cancel_tasks(group):
+    '''
+    Cancel all queued and running tasks of this group, e.g. when a
+    liststore is cleared, its icons are no longer needed.
+    '''
+    executor.cancel_group(group)
+
+def start_thread(func, *args):
+    '''
+    Long-running jobs, like downloading songs, are run in their own
+    threads, so that they do not block the executor.
+    '''
+    thread = threading.Thread(target=func, args=args)
+    thread.daemon = True
     thread.start()
+    return thread
+
+class HostHealth:
+    '''
+    Track failures of each host, to fail fast when it is down.
+
+    After `threshold` continuous failures, the circuit of a host is
+    opened, and requests to it fail immediately until its backoff time
+    is over. Then only one more request (the probe) is allowed, others
+    still fail until it returns or `probe_timeout` seconds pass. If the
+    probe fails, the backoff time is doubled, up to `max_backoff` seconds.
+    '''
+    def __init__(self, threshold=3, base_backoff=2, max_backoff=300,
+            probe_timeout=REQ_TIMEOUT):
+        self.threshold = threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.probe_timeout = probe_timeout
+        # host -> [continuous failures, time until circuit is closed]
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def available(self, host):
+        with self.lock:
+            state = self.hosts.get(host)
+            if state is None or state[0] < self.threshold:
+                return True
+            now = time.time()
+            if state[1] > now:
+                return False
+            # let this request probe the host, and hold back others.
+            state[1] = now + self.probe_timeout
+            return True
+
+    def success(self, host):
+        with self.lock:
+            self.hosts.pop(host, None)
+
+    def failure(self, host):
+        with self.lock:
+            state = self.hosts.setdefault(host, [0, 0])
+            state[0] += 1
+            if state[0] >= self.threshold:
+                n = state[0] - self.threshold
+                state[1] = time.time() + self.backoff(n, self.max_backoff)
+                print('Warning: Net.HostHealth, host seems down:', host)
+
+    def backoff(self, retried, max_backoff=None):
+        '''
+        Exponential backoff with jitter, in seconds.
+        '''
+        if max_backoff is None:
+            max_backoff = self.max_backoff
+        delay = min(max_backoff, self.base_backoff * 2 ** retried)
+        return random.uniform(delay / 2, delay)
+
+host_health = HostHealth()
+
+
+class SingleFlight:
+    '''
+    Concurrent calls with the same key are merged into one: the first
+    caller runs the function, others wait for it and share its result.
+    '''
+    class Call:
+        def __init__(self):
+            self.event = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.stats = {
+                'calls': 0,
+                'shared': 0,
+                }
+
+    def do(self, key, func, *args):
+        with self.lock:
+            call = self.calls.get(key)
+            if call is not None:
+                self.stats['shared'] += 1
+                leader = False
+            else:
+                call = SingleFlight.Call()
+                self.calls[key] = call
+                self.stats['calls'] += 1
+                leader = True
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func(*args)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.event.set()
+        return call.result
+
+# `shared` in its stats is the number of network requests saved.
+single_flight = SingleFlight()
+
+# all songs and mvs are downloaded through this, so that the song being
+# played is not slowed down by prefetching and caching.
+download_scheduler = Download.Scheduler(Config.DOWNLOAD_ACTIVE)
+# resolved links of songs, they are expired on server after a while.
+link_cache = Cache.LRUCache(Config.LINK_CACHE_NUM,
+        ttl=Config.CACHE_TTL['song-link'], sizeof=lambda link: 1)
+# rid of songs whose links are being prefetched.
+link_prefetching = set()
+link_prefetch_lock = threading.Lock()
+# decoded lyrics background images, keyed by url.
+background_cache = Cache.LRUCache(Config.BACKGROUND_CACHE_SIZE,
+        sizeof=lambda pix: pix.get_rowstride() * pix.get_height())
+# urls of background images failed in this session, not tried again.
+background_failed = set()
+
+# AsyncSong and AsyncMV objects which want the same file share one
+# download.
+download_registry = Download.Registry()
+
+def _schedule_progress(func, delay):
+    GObject.timeout_add(int(delay * 1000), func)
+
+# progress of all downloads, updated at most 4 times a second, views
+# like player and Caching tab can observe it.
+download_progress = Download.Progress(_schedule_progress)
 
 def hash_byte(_str):
     return hashlib.sha512(_str.encode()).digest()
@@ -84,29 +612,107 @@ def hash_byte(_str):
 def hash_str(_str):
     return hashlib.sha1(_str.encode()).hexdigest()
 
-def urlopen(_url, use_cache=True, retries=MAXTIMES):
+def urlopen(_url, use_cache=True, retries=MAXTIMES, ttl='default'):
+    '''
+    ttl is the name of ttl class in Config.CACHE_TTL, it decides how long
+    the response is cached.
+    Returns None if failed, or the response is empty. Failed urls are
+    kept in neg_cache for NEG_CACHE_TTL seconds.
+    '''
     # set host port from 81 to 80, to fix image problem
     url = _url.replace(':81', '')
     # hash the url to accelerate string compare speed in db.
     key = hash_byte(url)
-    if use_cache and leveldb_imported:
-        try:
-            return ldb.Get(key)
-        except KeyError:
-            pass
+    if use_cache:
+        req_content = ldb.get(key)
+        if req_content is not None:
+            return req_content
+    if neg_cache.get(url):
+        return None
+    return single_flight.do(('url', url), _urlopen, url, key, use_cache,
+            retries, ttl)
+
+def _urlopen(url, key, use_cache, retries, ttl):
+    # Worst time of this call is limited to REQ_DEADLINE seconds.
+    deadline = time.time() + REQ_DEADLINE
+    host = parse.urlsplit(url).netloc
     retried = 0
+    # the last try failed because all pooled connections were busy.
+    pool_busy = False
     while retried < retries:
+        if not host_health.available(host):
+            print('Warning: Net.urlopen, host is down:', host, 'url:', url)
+            break
+        timeout = min(REQ_TIMEOUT, deadline - time.time())
+        if timeout <= 0:
+            break
+        pool_busy = False
         try:
-            req = request.urlopen(url, timeout=TIMEOUT)
+            req = http_pool.urlopen(url, timeout=timeout)
             req_content = req.read()
-            if use_cache and leveldb_imported:
-                ldb.Put(key, req_content)
-            return req_content
+        except PoolTimeout as e:
+            print('Warning: Net.urlopen', e, 'url:', url)
+            pool_busy = True
+            continue
+        except urllib.error.HTTPError as e:
+            print('Error: Net.urlopen', e, 'url:', url)
+            # host is alive, but this url is not available
+            if e.code < 500:
+                host_health.success(host)
+                break
+            host_health.failure(host)
         except Exception as e:
             print('Error: Net.urlopen', e, 'url:', url)
-            retried += 1
-    if retried == MAXTIMES:
+            host_health.failure(host)
+        else:
+            host_health.success(host)
+            if not req_content:
+                break
+            if use_cache:
+                ldb.put(key, req_content, ttl)
+            return req_content
+        retried += 1
+        if retried < retries:
+            delay = host_health.backoff(retried - 1, REQ_TIMEOUT)
+            if time.time() + delay >= deadline:
+                break
+            time.sleep(delay)
+    if not pool_busy:
+        neg_cache.put(url, True)
+    return None
+
+def dump_file(content, filepath):
+    '''
+    Write to a temporary file first, so that others never see a partial
+    file at filepath.
+    '''
+    tmp_path = filepath + '.tmp-' + str(threading.get_ident())
+    with open(tmp_path, 'wb') as fh:
+        fh.write(content)
+    os.replace(tmp_path, filepath)
+
+def urlopen_obj(_url, parse_func, ttl='default'):
+    '''
+    Like urlopen(), but the content is decoded by parse_func(req_content),
+    and the parsed result is kept in obj_cache, so that it is not decoded
+    again when user goes back to the same page.
+    Returns None if failed to get or decode the content.
+    '''
+    url = _url.replace(':81', '')
+    key = hash_byte(url)
+    result = obj_cache.get(key)
+    if result is not None:
+        return result
+    req_content = urlopen(url, ttl=ttl)
+    if req_content is None:
+        return None
+    try:
+        result = parse_func(req_content)
+    except Exception as e:
+        print('Error: Net.urlopen_obj():', e, 'with url:', url)
         return None
+    obj_cache.put(key, result, ttl=Config.CACHE_TTL[ttl])
+    return result
 
 def get_nodes(nid, page):
     # node list contains very few items
@@ -120,36 +726,31 @@ def get_nodes(nid, page):
         str(nid),
         ])
     print('get_nodes()', url)
-    req_content = urlopen(url)
-    if req_content is None:
-        return (None, 0)
-    try:
+    def _parse(req_content):
         nodes_wrap = json.loads(req_content.decode())
-    except Exception as e:
-        print('Error: Net.get_nodes:', e, 'with url:', url)
+        nodes = nodes_wrap['child']
+        pages = math.ceil(int(nodes_wrap['total']) / ICON_NUM)
+        return (nodes, pages)
+    result = urlopen_obj(url, _parse, ttl='nodes')
+    if result is None:
         return (None, 0)
-    nodes = nodes_wrap['child']
-    pages = math.ceil(int(nodes_wrap['total']) / ICON_NUM)
-    return (nodes, pages)
+    return result
 
 def get_image(url):
-    def _get_image(url): 
-        return urlopen(url, use_cache=False)
-    
-    def _dump_image(image, filepath):
-        with open(filepath, 'wb') as fh:
-            fh.write(image)
+    def _get_image(url, filepath):
+        if os.path.exists(filepath):
+            return filepath
+        image = urlopen(url, use_cache=False)
+        if image is None:
+            return None
+        dump_file(image, filepath)
+        return filepath
 
     filename = os.path.split(url)[1]
     filepath = os.path.join(Config.IMG_DIR, filename)
     if os.path.exists(filepath):
         return filepath
-
-    image = _get_image(url)
-    if image is not None:
-        _dump_image(image, filepath)
-        return filepath
-    return None
+    return single_flight.do(('file', filepath), _get_image, url, filepath)
 
 def get_album(albumid):
     url = ''.join([
@@ -158,16 +759,10 @@ def get_album(albumid):
         str(albumid),
         ])
     print('get_album():', url)
-    req_content = urlopen(url)
-    if req_content is None:
-        return None
-    try:
-        songs_wrap = Utils.json_loads_single(req_content.decode())
-    except Exception as e:
-        print('Error: Net.get_album()', e, 'with url:', url)
-        return None
-    songs = songs_wrap['musiclist']
-    return songs
+    def _parse(req_content):
+        songs_wrap = Utils.json_loads_single(req_content)
+        return songs_wrap['musiclist']
+    return urlopen_obj(url, _parse, ttl='lists')
 
 def update_liststore_image(liststore, path, col, url):
     def _update_image(filepath, error=None):
@@ -181,7 +776,8 @@ def update_liststore_image(liststore, path, col, url):
                     'with filepath:', filepath, 'url:', url)
     if len(url) < 10:
         return
-    async_call(get_image, _update_image, url)
+    async_call(get_image, _update_image, url, priority=PRIORITY_ICON,
+            group=liststore)
 
 def update_album_covers(liststore, path, col, _url):
     url = _url.strip()
@@ -216,13 +812,14 @@ def get_toplist_songs(nid):
         str(nid),
         ])
     print('get toplist songs(), url:', url)
-    if url not in req_cache:
+    req_content = req_cache.get(url)
+    if req_content is None:
         req_content = urlopen(url, use_cache=False)
         if req_content is None:
             return None
-        req_cache[url] = req_content
+        req_cache.put(url, req_content)
     try:
-        songs_wrap = json.loads(req_cache[url].decode())
+        songs_wrap = json.loads(req_content.decode())
     except Exception as e:
         print('Error: Net.get_toplist_songs:', e, 'with url:', url)
         return None
@@ -241,17 +838,15 @@ def get_artists(catid, page, prefix):
     if len(prefix) > 0:
         url = url + '&prefix=' + prefix
     print('Net.get_artists(), url:', url)
-    req_content = urlopen(url)
-    if req_content is None:
+    def _parse(req_content):
+        artists_wrap = Utils.json_loads_single(req_content)
+        pages = int(artists_wrap['total'])
+        artists = artists_wrap['artistlist']
+        return (artists, pages)
+    result = urlopen_obj(url, _parse, ttl='nodes')
+    if result is None:
         return (None, 0)
-    try:
-        artists_wrap = Utils.json_loads_single(req_content.decode())
-    except Exception as e:
-        print('Error: Net.get_artists:', e, 'with url:', url)
-        return (None, 0)
-    pages = int(artists_wrap['total'])
-    artists = artists_wrap['artistlist']
-    return (artists, pages)
+    return result
 
 def update_toplist_node_logo(liststore, path, col, url):
     update_liststore_image(liststore, path, col, url)
@@ -288,14 +883,11 @@ def get_artist_info(artistid, artist=None):
             str(artistid),
             ])
     print('Net.get_artist_info, url:', url)
-    req_content = urlopen(url)
-    if req_content is None:
-        return None
-    try:
-        info = Utils.json_loads_single(req_content.decode())
-    except Exception as e:
-        print('Error: Net.get_artist_info:', e, 'with url:', url)
+    info = urlopen_obj(url, Utils.json_loads_single, ttl='artist-info')
+    if info is None:
         return None
+    # cached info is shared, so copy it before replacing info['pic'].
+    info = dict(info)
     # set logo size to 100x100
     pic_path = info['pic']
     url = get_artist_pic_url(pic_path)
@@ -316,17 +908,15 @@ def get_artist_songs(artist, page):
         artist,
         ])
     print('Net.get_artist_songs()', url)
-    req_content = urlopen(url)
-    if req_content is None:
-        return (None, 0)
-    try:
-        songs_wrap = Utils.json_loads_single(req_content.decode())
-    except Exception as e:
-        print('Error: Net.get_artist_songs:', e, 'with url:', url)
+    def _parse(req_content):
+        songs_wrap = Utils.json_loads_single(req_content)
+        songs = songs_wrap['abslist']
+        pages = math.ceil(int(songs_wrap['TOTAL']) / SONG_NUM)
+        return (songs, pages)
+    result = urlopen_obj(url, _parse, ttl='lists')
+    if result is None:
         return (None, 0)
-    songs = songs_wrap['abslist']
-    pages = math.ceil(int(songs_wrap['TOTAL']) / SONG_NUM)
-    return (songs, pages)
+    return result
 
 def get_artist_songs_by_id(artistid, page):
     '''
@@ -342,17 +932,15 @@ def get_artist_songs_by_id(artistid, page):
         str(page),
         ])
     print('Net.get_artist_songs_by_id()', url)
-    req_content = urlopen(url)
-    if req_content is None:
-        return (None, 0)
-    try:
-        songs_wrap = Utils.json_loads_single(req_content.decode())
-    except Exception as e:
-        print('Error: Net.get-artist_songs_by_id:', e, 'with url:', url)
+    def _parse(req_content):
+        songs_wrap = Utils.json_loads_single(req_content)
+        songs = songs_wrap['musiclist']
+        pages = math.ceil(int(songs_wrap['total']) / SONG_NUM)
+        return (songs, pages)
+    result = urlopen_obj(url, _parse, ttl='lists')
+    if result is None:
         return (None, 0)
-    songs = songs_wrap['musiclist']
-    pages = math.ceil(int(songs_wrap['total']) / SONG_NUM)
-    return (songs, pages)
+    return result
 
 def get_artist_albums(artistid, page):
     '''http://search.kuwo.cn/r.s?stype=albumlist&artistid=336&sortby=1&rn=20&pn=0
@@ -367,17 +955,15 @@ def get_artist_albums(artistid, page):
         str(page),
         ])
     print('Net.get_artist_albums(), url:', url)
-    req_content = urlopen(url)
-    if req_content is None:
-        return (None, 0)
-    try:
-        albums_wrap = Utils.json_loads_single(req_content.decode())
-    except Exception as e:
-        print('Error:', e)
+    def _parse(req_content):
+        albums_wrap = Utils.json_loads_single(req_content)
+        albums = albums_wrap['albumlist']
+        pages = math.ceil(int(albums_wrap['total']) / ICON_NUM)
+        return (albums, pages)
+    result = urlopen_obj(url, _parse, ttl='lists')
+    if result is None:
         return (None, 0)
-    albums = albums_wrap['albumlist']
-    pages = math.ceil(int(albums_wrap['total']) / ICON_NUM)
-    return (albums, pages)
+    return result
 
 def get_artist_mv(artistid, page):
     '''
@@ -393,17 +979,15 @@ def get_artist_mv(artistid, page):
         str(page),
         ])
     print('Net.get_artist_mv(), url:', url)
-    req_content = urlopen(url)
-    if req_content is None:
+    def _parse(req_content):
+        mvs_wrap = Utils.json_loads_single(req_content)
+        mvs = mvs_wrap['mvlist']
+        pages = math.ceil(int(mvs_wrap['total']) / ICON_NUM)
+        return (mvs, pages)
+    result = urlopen_obj(url, _parse, ttl='lists')
+    if result is None:
         return (None, 0)
-    try:
-        mvs_wrap = Utils.json_loads_single(req_content.decode())
-    except Exception as e:
-        print('Error: Net.get_artist_mv:', e, 'with url:', url)
-        return (None, 0)
-    mvs = mvs_wrap['mvlist']
-    pages = math.ceil(int(mvs_wrap['total']) / ICON_NUM)
-    return (mvs, pages)
+    return result
 
 def get_artist_similar(artistid, page):
     '''
@@ -420,17 +1004,15 @@ def get_artist_similar(artistid, page):
         str(artistid),
         ])
     print('Net.get_artist_similar(), url:', url)
-    req_content = urlopen(url)
-    if req_content is None:
+    def _parse(req_content):
+        artists_wrap = Utils.json_loads_single(req_content)
+        artists = artists_wrap['artistlist']
+        pages = math.ceil(int(artists_wrap['total']) / ICON_NUM)
+        return (artists, pages)
+    result = urlopen_obj(url, _parse, ttl='lists')
+    if result is None:
         return (None, 0)
-    try:
-       artists_wrap = Utils.json_loads_single(req_content.decode())
-    except Exception as e:
-        print('Error: Net.get_artist_similar:', e, 'with url:', url)
-        return (None, 0)
-    artists = artists_wrap['artistlist']
-    pages = math.ceil(int(artists_wrap['total']) / ICON_NUM)
-    return (artists, pages)
+    return result
 
 def get_lrc(_rid):
     def _parse_lrc():
@@ -467,7 +1049,7 @@ def get_recommend_lists(artist):
         '&name=',
         Utils.encode_uri(artist),
         ])
-    req_content = urlopen(url)
+    req_content = urlopen(url, ttl='image-list')
     if req_content is None:
         return None
     return req_content.decode()
@@ -476,11 +1058,14 @@ def get_recommend_image(_url):
     '''
     Get big cover image about this artist, normally 1024x768
     '''
-    def _get_image(url): 
-        req_content = urlopen(url, use_cache=False)
-        if req_content is None:
+    def _get_image(url, filepath):
+        if os.path.exists(filepath):
+            return filepath
+        image = urlopen(url, use_cache=False)
+        if image is None:
             return None
-        return req_content
+        dump_file(image, filepath)
+        return filepath
 
     url = _url.strip()
     if len(url) == 0:
@@ -490,13 +1075,30 @@ def get_recommend_image(_url):
     filepath = os.path.join(Config.IMG_LARGE_DIR, filename)
     if os.path.exists(filepath):
         return filepath
+    return single_flight.do(('file', filepath), _get_image, url, filepath)
 
-    image = _get_image(url)
-    if image is None:
+def get_recommend_pixbuf(url):
+    '''
+    Get big image of artist decoded as Pixbuf, so that it is loaded in
+    background thread instead of main loop.
+    Each url is downloaded once in a session, the image file is kept on
+    disk and decoded again only if it is dropped from memory.
+    '''
+    url = url.strip()
+    pix = background_cache.get(url)
+    if pix is not None or url in background_failed:
+        return pix
+    filepath = get_recommend_image(url)
+    if filepath:
+        try:
+            pix = GdkPixbuf.Pixbuf.new_from_file(filepath)
+        except Exception as e:
+            print('Error: Net.get_recommend_pixbuf:', e, 'with url:', url)
+    if pix is None:
+        background_failed.add(url)
         return None
-    with open(filepath, 'wb') as fh:
-        fh.write(image)
-    return filepath
+    background_cache.put(url, pix)
+    return pix
 
 def search_songs(keyword, page):
     url = ''.join([
@@ -510,13 +1112,14 @@ def search_songs(keyword, page):
         str(page),
         ])
     print('search songs:', url)
-    if url not in req_cache:
+    req_content = req_cache.get(url)
+    if req_content is None:
         req_content = urlopen(url, use_cache=False)
         if req_content is None:
             return (None, 0, 0)
-        req_cache[url] = req_content
+        req_cache.put(url, req_content)
     try:
-        songs_wrap = Utils.json_loads_single(req_cache[url].decode())
+        songs_wrap = Utils.json_loads_single(req_content)
     except Exception as e:
         print('Error: Net.search_song:', e, 'with url:', url)
         return (None, 0, 0)
@@ -537,13 +1140,14 @@ def search_artists(keyword, page):
         parse.quote(keyword),
         ])
     print('Net.search_artists(), ', url)
-    if url not in req_cache:
+    req_content = req_cache.get(url)
+    if req_content is None:
         req_content = urlopen(url, use_cache=False)
         if req_content is None:
             return (None, 0, 0)
-        req_cache[url] = req_content
+        req_cache.put(url, req_content)
     try:
-        artists_wrap = Utils.json_loads_single(req_cache[url].decode())
+        artists_wrap = Utils.json_loads_single(req_content)
     except Exception as e:
         print('Error: Net.search_artists():', e, 'with url:', url)
         return (None, 0, 0)
@@ -564,13 +1168,14 @@ def search_albums(keyword, page):
         parse.quote(keyword),
         ])
     print('search_albums:', url)
-    if url not in req_cache:
+    req_content = req_cache.get(url)
+    if req_content is None:
         req_content = urlopen(url, use_cache=False)
         if req_content is None:
             return (None, 0, 0)
-        req_cache[url] = req_content
+        req_cache.put(url, req_content)
     try:
-        albums_wrap = Utils.json_loads_single(req_cache[url].decode())
+        albums_wrap = Utils.json_loads_single(req_content)
     except Exception as e:
         print('Error: Net.search_albums():', e, 'with url:', url)
         return (None, 0, 0)
@@ -591,15 +1196,9 @@ def get_index_nodes(nid):
         str(nid),
         ])
     print('get_index_nodes():', url)
-    req_content = urlopen(url)
-    if req_content is None:
-        return None
-    try:
-        nodes_wrap = json.loads(req_content.decode())
-    except Exception as e:
-        print('Error: Net.get_index_nodes():', e, 'with url:', url)
-        return None
-    return nodes_wrap
+    def _parse(req_content):
+        return json.loads(req_content.decode())
+    return urlopen_obj(url, _parse, ttl='nodes')
 
 def get_themes_main():
     def append_to_nodes(nid, use_child=True):
@@ -659,13 +1258,14 @@ def get_themes_songs(nid, page):
         str(page),
         ])
     print('Net.get themes songs, url:', url)
-    if url not in req_cache:
+    req_content = req_cache.get(url)
+    if req_content is None:
         req_content = urlopen(url, use_cache=False)
         if req_content is None:
             return (None, 0)
-        req_cache[url] = req_content
+        req_cache.put(url, req_content)
     try:
-        songs_wrap = json.loads(req_cache[url].decode())
+        songs_wrap = json.loads(req_content.decode())
     except Exception as e:
         print('Error: Net.get_themes_songs():', e, 'with url:', url)
         return (None, 0)
@@ -683,17 +1283,15 @@ def get_mv_songs(pid, page):
         str(pid),
         ])
     print('Net.get_mv_songs(), url:', url)
-    req_content = urlopen(url)
-    if req_content is None:
-        return (None, 0)
-    try:
+    def _parse(req_content):
         songs_wrap = json.loads(req_content.decode())
-    except Exception as e:
-        print('Error: Net.get_mv_songs():', e, 'with url:', url)
+        songs = songs_wrap['musiclist']
+        pages = math.ceil(int(songs_wrap['total']) / ICON_NUM)
+        return (songs, pages)
+    result = urlopen_obj(url, _parse, ttl='lists')
+    if result is None:
         return (None, 0)
-    songs = songs_wrap['musiclist']
-    pages = math.ceil(int(songs_wrap['total']) / ICON_NUM)
-    return (songs, pages)
+    return result
 
 def get_radios_nodes():
     nid = 8
@@ -707,48 +1305,19 @@ def get_radio_songs(nid, offset):
         '&offset=',
         str(offset),
         ])
-    req_content = urlopen(url)
+    req_content = urlopen(url, ttl='radio')
     if req_content is None:
         return None
     songs = Utils.parse_radio_songs(req_content.decode('gbk'))
     return songs
 
-def _get_song_link_raw(song, conf, use_mv=False):
-    if use_mv:
-        ext = 'mkv|mp4' if conf['use-mkv'] else 'mp4'
-    else:
-        ext = 'ape|mp3' if conf['use-ape'] else 'mp3'
-    url = ''.join([
-        SONG,
-        'response=url&type=convert_url&format=',
-        ext,
-        '&rid=MUSIC_',
-        str(song['rid']),
-        ])
-    print('Net._get_song_link_raw(), url', url)
-    req_content = urlopen(url)
-    if req_content is None:
-        return None
-    song_link = req_content.decode()
-    if len(song_link) < 20:
-        return None
-    song_list = song_link.split('/')
-    song_link = '/'.join(song_list[:3] + song_list[5:])
-    song_name = os.path.split(song_link)[1]
-    if use_mv:
-        song_path = os.path.join(conf['mv-dir'], song_name)
-    else:
-        song_path = os.path.join(conf['song-dir'], song_name)
-    if os.path.exists(song_path):
-        return (True, song_path)
-    return (song_link, song_path)
-
-def get_song_link(song, conf, use_mv=False):
+def get_song_link(song, conf, use_mv=False, refresh=False):
     '''
     song is song_info dict.
     conf, is used to to read conf['use-ape'], conf['use-mkv'],
     conf['song-dir'] and song['mv-dir'].
     use_mv, default is False, which will get mp3 link.
+    refresh, if True, the cached link is dropped and resolved again.
     Return:
      @song_link: if is True, local song exists
                  if is False, no available song_link
@@ -781,9 +1350,15 @@ def get_song_link(song, conf, use_mv=False):
     if os.path.exists(song_path):
         # if song/MV exists, just return it
         return (True, song_path)
-    req_content = urlopen(url)
+    if refresh:
+        link_cache.pop(url)
+    req_content = link_cache.get(url)
     if req_content is None:
-        return (False, song_path)
+        # links expire on server, so they are not saved in ldb.
+        req_content = urlopen(url, use_cache=False)
+        if req_content is None:
+            return (False, song_path)
+        link_cache.put(url, req_content)
     song_link = req_content.decode()
     if len(song_link) < 20:
         return (False, song_path)
@@ -795,6 +1370,93 @@ def get_song_link(song, conf, use_mv=False):
         return (True, song_path)
     return (song_link, song_path)
 
+def get_song_links(songs, conf, use_mv=False):
+    '''
+    Resolve links of a batch of songs, results are cached, so it is
+    used to prepare links of songs to be downloaded.
+    Returns a list of (song_link, song_path).
+    '''
+    return [get_song_link(song, conf, use_mv) for song in songs]
+
+def prefetch_song_links(songs, conf, callback=None, use_mv=False):
+    '''
+    Resolve links of songs to be played or cached soon, in background
+    tasks of at most LINK_BATCH songs.
+    callback(songs, links) is called in main thread after each batch.
+    '''
+    def _on_links_resolved(batch):
+        def _on_done(links, error=None):
+            with link_prefetch_lock:
+                for song in batch:
+                    link_prefetching.discard(song['rid'])
+            if callback and links:
+                callback(batch, links)
+        return _on_done
+
+    with link_prefetch_lock:
+        songs = [song for song in songs if
+                song['rid'] not in link_prefetching]
+        for song in songs:
+            link_prefetching.add(song['rid'])
+    for i in range(0, len(songs), LINK_BATCH):
+        batch = songs[i:i+LINK_BATCH]
+        async_call(get_song_links, _on_links_resolved(batch), batch, conf,
+                use_mv, priority=PRIORITY_PREFETCH)
+
+def get_segments(transfer):
+    '''
+    Only the file being played is downloaded with all segments, so that
+    pooled connections are not held by background downloads.
+    '''
+    if transfer.priority == Download.PRIORITY_PLAYING:
+        return Config.DOWNLOAD_SEGMENTS
+    return min(Config.DOWNLOAD_SEGMENTS, Config.DOWNLOAD_SEGMENTS_BACKGROUND)
+
+def seek_transfer(transfer, seconds, duration):
+    '''
+    Fetch data at `seconds` of a file being downloaded before other parts
+    of it. Position is mapped to byte offset with its header, or with
+    `duration` if the header is not parsed.
+    Returns (offset, size) of data to wait for, or None if it is received
+    or the position is unknown.
+    '''
+    if transfer is None or transfer.download is None:
+        return None
+    download = transfer.download
+    info = None
+    if transfer.buffering:
+        info = transfer.buffering.info
+    if info is None:
+        if not download.length or not duration:
+            return None
+        info = MediaInfo.MediaInfo(duration, download.length)
+    offset = info.get_offset(seconds)
+    size = int(info.byte_rate() * SEEK_BUFFER_TIME)
+    if download.is_available(offset, size):
+        return None
+    if download.seek(offset, size):
+        print('Net.seek_transfer(), fetch from {0} at once'.format(offset))
+    return (offset, size)
+
+def is_seek_received(transfer, target):
+    offset, size = target
+    return transfer.download.is_available(offset, size)
+
+def get_media_info(transfer, filepath):
+    '''
+    Get MediaInfo of a file to play, which may be still downloading.
+    The header parsed for buffering is reused if it is available.
+    '''
+    if transfer and transfer.buffering and transfer.buffering.info:
+        return transfer.buffering.info
+    if transfer and transfer.download and transfer.download.length:
+        size = transfer.download.length
+    elif os.path.exists(filepath):
+        size = os.path.getsize(filepath)
+    else:
+        return None
+    return MediaInfo.parse_file(filepath, size)
+
 
 class AsyncSong(GObject.GObject):
     '''
@@ -823,52 +1485,38 @@ class AsyncSong(GObject.GObject):
         super().__init__()
         self.app = app
         self.force_quit = False
+        self.download = None
+        self.transfer = None
 
     def destroy(self):
         self.force_quit = True
+        if self.transfer:
+            self.transfer.detach(self)
 
-    def get_song(self, song):
+    def seek(self, seconds, duration):
+        '''
+        Returns a target for is_received() if data at `seconds` is not
+        downloaded yet, or None.
+        '''
+        return seek_transfer(self.transfer, seconds, duration)
+
+    def is_received(self, target):
+        return is_seek_received(self.transfer, target)
+
+    def get_song(self, song, priority=Download.PRIORITY_PLAYING):
         '''
         Get the actual link of music file.
         If higher quality of that music unavailable, a lower one is used.
         like this:
         response=url&type=convert_url&format=ape|mp3&rid=MUSIC_3312608
+        priority is one of Download.PRIORITY_PLAYING, PRIORITY_NEXT and
+        PRIORITY_CACHING.
+        If this song is being downloaded by another AsyncSong, signals
+        of that download are emitted instead of starting a new one.
         '''
-        async_call(self._download_song, empty_func, song)
-
-    def _download_song(self, song):
-        def _wrap(req):
-            received_size = 0
-            can_play_emited = False
-            content_length = int(req.headers.get('Content-Length'))
-            print('size of file: ', round(content_length / 2**20, 2), 'M')
-            fh = open(song_path, 'wb')
-
-            while True:
-                if self.force_quit:
-                    del req
-                    fh.close()
-                    os.remove(song_path)
-                    return
-                chunk = req.read(CHUNK)
-                received_size += len(chunk)
-                percent = int(received_size/content_length * 100)
-                self.emit('chunk-received', percent)
-                #print('percentage:', percent)
-                # this signal only emit once.
-                if (received_size > CHUNK_TO_PLAY or percent > 40) \
-                        and not can_play_emited:
-                    print('song can be played now')
-                    can_play_emited = True
-                    self.emit('can-play', song_path)
-                if not chunk:
-                    break
-                fh.write(chunk)
-            fh.close()
-            print('song downloaded')
-            self.emit('downloaded', song_path)
-            Utils.iconvtag(song_path, song)
+        start_thread(self._download_song, song, priority)
 
+    def _download_song(self, song, priority):
         song_link, song_path = get_song_link(song, self.app.conf)
         if song_link is False:
             self.emit('can-play', None)
@@ -879,26 +1527,83 @@ class AsyncSong(GObject.GObject):
             self.emit('can-play', song_path)
             self.emit('downloaded', song_path)
             return
+        if self.force_quit:
+            return None
+        transfer, is_owner = download_registry.join(song_path, self,
+                priority)
+        self.transfer = transfer
+        if self.force_quit:
+            # destroyed before transfer was set, detach here instead.
+            transfer.detach(self)
+            if not is_owner or download_registry.leave(transfer,
+                    stopped=True):
+                return None
+        if not is_owner:
+            print('Net.AsyncSong, song is being downloaded:', song_path)
+            return None
+        try:
+            return self._run_download(transfer, song, song_link, song_path)
+        finally:
+            download_registry.leave(transfer)
+            download_progress.finish(song_path)
+
+    def _run_download(self, transfer, song, song_link, song_path):
+        def _on_chunk(received_size, content_length):
+            percent = download_progress.update(song_path, received_size,
+                    content_length)
+            if percent is not None:
+                transfer.emit('chunk-received', percent)
+            # this signal only emit once.
+            if not transfer.emitted('can-play') and \
+                    buffering.can_play(received_size, content_length):
+                print('song can be played now, waited {0:.2f}s'.format(
+                    buffering.wait_time))
+                transfer.emit('can-play', download.part_path)
+
+        # partial file is played while downloading, and is renamed to
+        # song_path when it is completed.
+        download = Download.Download(http_pool, song_link, song_path,
+                segments=get_segments(transfer), head_size=CHUNK_TO_PLAY,
+                scheduler=download_scheduler)
+        download.load_meta()
+        buffering = MediaInfo.Buffering(download.part_path, CHUNK_TO_PLAY,
+                40)
+        transfer.set_download(download, buffering)
+        self.download = download
         retried = 0
+        relinked = False
         print('Net.AsyncSong, song will be downloaded:', song_path)
         while retried < MAXTIMES:
             try:
-                req = request.urlopen(song_link)
-                _wrap(req)
+                if not download.run(_on_chunk):
+                    if download_registry.leave(transfer, stopped=True):
+                        return None
+                    # another listener is attached after cancelling.
+                    continue
+                print('song downloaded')
+                if not transfer.emitted('can-play'):
+                    transfer.emit('can-play', song_path)
+                transfer.emit('downloaded', song_path)
+                Utils.iconvtag(song_path, song)
                 return song
             except Exception as e:
                 print('AsyncSong._download_song()', e, 'with song_link:',
                         song_link)
                 retried += 1
+                if not relinked:
+                    # cached link may be expired, resolve it again once.
+                    relinked = True
+                    new_link, new_path = get_song_link(song, self.app.conf,
+                            refresh=True)
+                    if new_path == song_path and isinstance(new_link, str):
+                        song_link = download.link = new_link
         # remember to check song when `downloaded` signal received.
-        if retried == MAXTIMES:
-            print('song failed to download, please check link', song_link)
-            # If failed to download, partial mp3 file needs to be deleted
-            if os.path.exists(song_path):
-                os.remove(song_path)
-            self.emit('can-play', None)
-            self.emit('downloaded', None)
-            return None
+        # Partial file is kept, so that it can be resumed next time.
+        print('song failed to download, please check link', song_link)
+        if not transfer.emitted('can-play'):
+            transfer.emit('can-play', None)
+        transfer.emit('downloaded', None)
+        return None
 GObject.type_register(AsyncSong)
 
 
@@ -916,43 +1621,28 @@ class AsyncMV(GObject.GObject):
         super().__init__()
         self.app = app
         self.force_quit = False
+        self.download = None
+        self.transfer = None
 
     def destroy(self):
         self.force_quit = True
+        if self.transfer:
+            self.transfer.detach(self)
+
+    def seek(self, seconds, duration):
+        '''
+        Returns a target for is_received() if data at `seconds` is not
+        downloaded yet, or None.
+        '''
+        return seek_transfer(self.transfer, seconds, duration)
+
+    def is_received(self, target):
+        return is_seek_received(self.transfer, target)
 
     def get_mv(self, song):
-        async_call(self._download_mv, empty_func, song)
+        start_thread(self._download_mv, song)
 
     def _download_mv(self, song):
-        def _wrap(req):
-            received_size = 0
-            can_play_emited = False
-            content_length = int(req.headers.get('Content-Length'))
-            print('size of file: ', round(content_length / 2**20, 2), 'M')
-            fh = open(mv_path, 'wb')
-            while True:
-                if self.force_quit:
-                    del req
-                    fh.close()
-                    os.remove(mv_path)
-                    return
-                chunk = req.read(CHUNK)
-                received_size += len(chunk)
-                percent = int(received_size/content_length * 100)
-                self.emit('chunk-received', percent)
-                #print('percentage:', percent)
-                if (received_size > CHUNK_MV_TO_PLAY or percent > 20) \
-                        and not can_play_emited:
-                    can_play_emited = True
-                    print('mv can play now')
-                    self.emit('can-play', mv_path)
-                if not chunk:
-                    break
-                fh.write(chunk)
-            fh.close()
-            print('mv downloaded')
-            self.emit('downloaded', mv_path)
-
         mv_link, mv_path = get_song_link(song, self.app.conf, True)
         if mv_link is False:
             self.emit('can-play', None)
@@ -963,22 +1653,72 @@ class AsyncMV(GObject.GObject):
             self.emit('can-play', mv_path)
             self.emit('downloaded', mv_path)
             return
+        if self.force_quit:
+            return None
+        transfer, is_owner = download_registry.join(mv_path, self)
+        self.transfer = transfer
+        if self.force_quit:
+            # destroyed before transfer was set, detach here instead.
+            transfer.detach(self)
+            if not is_owner or download_registry.leave(transfer,
+                    stopped=True):
+                return None
+        if not is_owner:
+            print('Net.AsyncMV, mv is being downloaded:', mv_path)
+            return None
+        try:
+            return self._run_download(transfer, song, mv_link, mv_path)
+        finally:
+            download_registry.leave(transfer)
+            download_progress.finish(mv_path)
+
+    def _run_download(self, transfer, song, mv_link, mv_path):
+        def _on_chunk(received_size, content_length):
+            percent = download_progress.update(mv_path, received_size,
+                    content_length)
+            if percent is not None:
+                transfer.emit('chunk-received', percent)
+            if not transfer.emitted('can-play') and \
+                    buffering.can_play(received_size, content_length):
+                print('mv can play now, waited {0:.2f}s'.format(
+                    buffering.wait_time))
+                transfer.emit('can-play', download.part_path)
+
+        download = Download.Download(http_pool, mv_link, mv_path,
+                segments=get_segments(transfer),
+                head_size=CHUNK_MV_TO_PLAY, scheduler=download_scheduler)
+        download.load_meta()
+        buffering = MediaInfo.Buffering(download.part_path,
+                CHUNK_MV_TO_PLAY, 20)
+        transfer.set_download(download, buffering)
+        self.download = download
         retried = 0
+        relinked = False
         print('Net.AsyncSong, mv will be downloaded:', mv_path)
         while retried < MAXTIMES:
             try:
-                req = request.urlopen(mv_link)
-                self.req = req
-                _wrap(req)
+                if not download.run(_on_chunk):
+                    if download_registry.leave(transfer, stopped=True):
+                        return None
+                    # another listener is attached after cancelling.
+                    continue
+                print('mv downloaded')
+                if not transfer.emitted('can-play'):
+                    transfer.emit('can-play', mv_path)
+                transfer.emit('downloaded', mv_path)
                 return mv_path
             except Exception as e:
                 print('AsyncMV.getmv()', e, 'with mv_link:', mv_link)
                 retried += 1
-        if retried == MAXTIMES:
-            if os.path.exists(mv_path):
-                os.rm(mv_path)
-            print('mv failed to download, please check link', mv_link)
-            self.emit('can-play', None)
-            self.emit('downloaded', None)
-            return None
+                if not relinked:
+                    relinked = True
+                    new_link, new_path = get_song_link(song, self.app.conf,
+                            True, refresh=True)
+                    if new_path == mv_path and isinstance(new_link, str):
+                        mv_link = download.link = new_link
+        print('mv failed to download, please check link', mv_link)
+        if not transfer.emitted('can-play'):
+            transfer.emit('can-play', None)
+        transfer.emit('downloaded', None)
+        return None
 GObject.type_register(AsyncMV)
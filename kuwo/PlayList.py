@@ -14,7 +14,9 @@ import threading
 import time
 
 from kuwo import Config
+from kuwo import Download
 from kuwo import Net
+from kuwo import Utils
 from kuwo import Widgets
 
 _ = Config._
@@ -27,6 +29,12 @@ DRAG_TARGETS = [
         ]
 DRAG_ACTION = Gdk.DragAction.DEFAULT | Gdk.DragAction.COPY
 
+# links of this many songs in Caching tab are resolved ahead of workers.
+CACHE_LINK_BATCH = 10
+# failed songs are retried after this delay, doubled on each failure.
+CACHE_RETRY_DELAY = 30
+CACHE_RETRY_MAX_DELAY = 1800
+
 class NormalSongTab(Gtk.ScrolledWindow):
     def __init__(self, app, list_name):
         super().__init__()
@@ -114,8 +122,15 @@ class PlayList(Gtk.Box):
         self.curr_playing = [None, None]
 
         self.cache_enabled = False
-        self.cache_job = None
+        # rid -> Net.AsyncSong, songs being cached in Caching tab.
+        self.cache_jobs = {}
+        # rid -> (failed times, timestamp to retry)
+        self.cache_failed = {}
+        # rid of songs whose links have been resolved ahead.
+        self.cache_resolved = set()
+        self.cache_stats = None
         self.cache_timeout = 0
+        self.cache_progress_timeout = 0
 
         self.cache_next_async_song = None
 
@@ -182,8 +197,8 @@ class PlayList(Gtk.Box):
         self.conn.commit()
         self.conn.close()
         self.dump_playlists()
-        if self.cache_job:
-            self.cache_job.destroy()
+        for cache_job in self.cache_jobs.values():
+            cache_job.destroy()
         if self.cache_next_async_song:
             self.cache_next_async_song.destroy()
 
@@ -278,6 +293,8 @@ class PlayList(Gtk.Box):
             button_start = Gtk.Button(_('Start Caching'))
             button_start.connect('clicked', self.switch_caching_daemon)
             buttonbox.pack_start(button_start, False, False, 0)
+            self.cache_label = Gtk.Label()
+            buttonbox.pack_start(self.cache_label, False, False, 10)
             box_caching.pack_start(scrolled_win, True, True, 0)
             self.notebook.append_page(box_caching, Gtk.Label(_('Caching')))
             box_caching.show_all()
@@ -364,6 +381,9 @@ class PlayList(Gtk.Box):
         #if path is not None:
         #    return
         liststore.append(Widgets.song_dict_to_row(song))
+        if self.cache_enabled and \
+                len(self.cache_jobs) < self.app.conf['cache-workers']:
+            self.do_cache_song_pool()
 
     def cache_songs(self, songs):
         for song in songs:
@@ -375,43 +395,161 @@ class PlayList(Gtk.Box):
         if not self.cache_enabled:
             self.cache_enabled = True
             btn.set_label(_('Stop Caching'))
-            self.cache_timeout = GLib.timeout_add(5000, 
-                    self.start_cache_daemon)
+            self.cache_stats = {
+                    'started': time.time(),
+                    'cached': 0,
+                    'failed': 0,
+                    # bytes received by finished jobs.
+                    'bytes': 0,
+                    'last-bytes': 0,
+                    'last-time': time.time(),
+                    }
+            self.cache_progress_timeout = GLib.timeout_add(1000,
+                    self.update_cache_progress)
+            self.do_cache_song_pool()
         else:
             self.cache_enabled = False
+            for cache_job in self.cache_jobs.values():
+                cache_job.destroy()
+            self.cache_jobs.clear()
             if self.cache_timeout > 0:
                 GLib.source_remove(self.cache_timeout)
+                self.cache_timeout = 0
+            if self.cache_progress_timeout > 0:
+                GLib.source_remove(self.cache_progress_timeout)
+                self.cache_progress_timeout = 0
+            self.cache_label.set_label('')
             btn.set_label(_('Start Caching'))
 
-    def start_cache_daemon(self):
-        if self.cache_enabled:
-            if self.cache_job is None:
-                self.do_cache_song_pool()
-            return True
-        else:
-            return False
+    def on_cache_timeout(self):
+        self.cache_timeout = 0
+        self.do_cache_song_pool()
+        return False
 
     def do_cache_song_pool(self):
-        def _move_song():
-            self.append_cached_song(song)
-            liststore.remove(liststore[path].iter)
-            Gdk.Window.process_all_updates()
-
-        def _on_downloaded(widget, song_path, error=None):
-            self.cache_job = None
-            GLib.idle_add(_move_song)
-
-        list_name = 'Caching'
-        liststore = self.tabs[list_name].liststore
-        path = 0
+        '''
+        Start caching songs from the top of Caching tab, until
+        conf['cache-workers'] songs are being downloaded.
+        It is called again when a song is finished or added, songs
+        failed to download are skipped and retried later.
+        '''
+        if not self.cache_enabled:
+            return
+        liststore = self.tabs['Caching'].liststore
         if len(liststore) == 0:
             print('Caching playlist is empty, please add some')
             return
-        song = Widgets.song_row_to_dict(liststore[path], start=0)
+        now = time.time()
+        retry_time = 0
+        songs = []
+        for row in liststore:
+            song = Widgets.song_row_to_dict(row, start=0)
+            rid = song['rid']
+            if rid in self.cache_jobs:
+                continue
+            if rid in self.cache_failed and self.cache_failed[rid][1] > now:
+                if not retry_time or self.cache_failed[rid][1] < retry_time:
+                    retry_time = self.cache_failed[rid][1]
+                continue
+            songs.append(song)
+        self.resolve_cache_links(songs[:CACHE_LINK_BATCH])
+        workers = self.app.conf['cache-workers']
+        for song in songs[:workers - len(self.cache_jobs)]:
+            self.start_cache_job(song)
+        if retry_time and self.cache_timeout == 0:
+            self.cache_timeout = GLib.timeout_add(
+                    int((retry_time - now) * 1000) + 1,
+                    self.on_cache_timeout)
+
+    def resolve_cache_links(self, songs):
+        '''
+        Resolve links of songs in one background task, so that workers
+        get them from cache. Songs without available link are skipped
+        for a while.
+        '''
+        def _on_links_resolved(songs, links):
+            for song, link in zip(songs, links):
+                if link[0] is False and song['rid'] not in self.cache_jobs:
+                    self.on_cache_job_failed(song['rid'])
+
+        songs = [song for song in songs if
+                song['rid'] not in self.cache_resolved]
+        if not songs:
+            return
+        for song in songs:
+            self.cache_resolved.add(song['rid'])
+        Net.prefetch_song_links(songs, self.app.conf, _on_links_resolved)
+
+    def start_cache_job(self, song):
+        def _on_downloaded(widget, song_path):
+            GLib.idle_add(self.on_cache_job_downloaded, song, song_path)
+
         print('song dict to download:', song)
-        self.cache_job = Net.AsyncSong(self.app)
-        self.cache_job.connect('downloaded', _on_downloaded)
-        self.cache_job.get_song(song)
+        cache_job = Net.AsyncSong(self.app)
+        cache_job.connect('downloaded', _on_downloaded)
+        self.cache_jobs[song['rid']] = cache_job
+        cache_job.get_song(song, Download.PRIORITY_CACHING)
+
+    def on_cache_job_downloaded(self, song, song_path):
+        rid = song['rid']
+        cache_job = self.cache_jobs.pop(rid, None)
+        if not self.cache_enabled or cache_job is None:
+            return
+        if cache_job.download:
+            self.cache_stats['bytes'] += \
+                    cache_job.download.stats['transferred']
+        if song_path:
+            self.cache_stats['cached'] += 1
+            self.cache_failed.pop(rid, None)
+            self.append_cached_song(song)
+            liststore = self.tabs['Caching'].liststore
+            path = self.get_song_path_in_liststore(liststore, rid, pos=3)
+            if path is not None:
+                liststore.remove(liststore[path].iter)
+            Gdk.Window.process_all_updates()
+        else:
+            self.cache_stats['failed'] += 1
+            self.on_cache_job_failed(rid)
+        self.do_cache_song_pool()
+
+    def on_cache_job_failed(self, rid):
+        failed_times = self.cache_failed.get(rid, (0, 0))[0] + 1
+        delay = min(CACHE_RETRY_DELAY * 2 ** (failed_times - 1),
+                CACHE_RETRY_MAX_DELAY)
+        self.cache_failed[rid] = (failed_times, time.time() + delay)
+        # link will be resolved again before retry.
+        self.cache_resolved.discard(rid)
+
+    def update_cache_progress(self):
+        if not self.cache_enabled:
+            return False
+        stats = self.cache_stats
+        received = stats['bytes']
+        for cache_job in self.cache_jobs.values():
+            if cache_job.download:
+                received += cache_job.download.stats['transferred']
+        now = time.time()
+        speed = (received - stats['last-bytes']) / max(
+                now - stats['last-time'], 0.001)
+        stats['last-bytes'] = received
+        stats['last-time'] = now
+        songs_per_min = stats['cached'] * 60 / max(now - stats['started'], 1)
+        percents = []
+        for cache_job in self.cache_jobs.values():
+            progress = None
+            if cache_job.transfer:
+                progress = Net.download_progress.get(cache_job.transfer.key)
+            if progress and progress[1]:
+                percents.append('{0}%'.format(
+                    int(progress[0] / progress[1] * 100)))
+        self.cache_label.set_label(', '.join([
+            _('{0} caching ({1}), {2} cached, {3} failed').format(
+                len(self.cache_jobs), ' '.join(percents), stats['cached'],
+                stats['failed']),
+            _('{0:.1f} songs/min, {1}/s').format(
+                songs_per_min, Utils.format_size(speed)),
+            ]))
+        return True
 
     # Others
     def on_song_downloaded(self, play=False):
@@ -432,8 +570,24 @@ class PlayList(Gtk.Box):
         path += 1
         song = Widgets.song_row_to_dict(liststore[path], start=0)
         print('next song to cache:', song)
+        if self.cache_next_async_song:
+            self.cache_next_async_song.destroy()
         self.cache_next_async_song = Net.AsyncSong(self.app)
-        self.cache_next_async_song.get_song(song)
+        self.cache_next_async_song.get_song(song, Download.PRIORITY_NEXT)
+
+    def prefetch_next_links(self):
+        '''
+        Resolve links of the next songs in current playlist.
+        '''
+        list_name, path = self.curr_playing
+        if list_name is None:
+            return
+        liststore = self.tabs[list_name].liststore
+        songs = []
+        for i in range(path + 1, min(path + 1 + Net.LINK_BATCH,
+                len(liststore))):
+            songs.append(Widgets.song_row_to_dict(liststore[i], start=0))
+        Net.prefetch_song_links(songs, self.app.conf)
 
     def get_prev_song(self, repeat=False):
         list_name = self.curr_playing[0]
@@ -455,7 +609,19 @@ class PlayList(Gtk.Box):
         return Widgets.song_row_to_dict(liststore[path], start=0)
 
     def get_next_song(self, repeat=False, shuffle=False):
+        next_song = self.peek_next_song(repeat, shuffle)
+        if next_song is None:
+            return None
+        self.curr_playing, song = next_song
+        return song
+
+    def peek_next_song(self, repeat=False, shuffle=False):
+        '''
+        Get (curr_playing, song) of the next song, without moving to it.
+        '''
         list_name = self.curr_playing[0]
+        if list_name is None:
+            return None
         liststore = self.tabs[list_name].liststore
         path = self.curr_playing[1]
         song_nums = len(liststore)
@@ -470,8 +636,8 @@ class PlayList(Gtk.Box):
             path = 0
         else:
             path = path + 1
-        self.curr_playing[1] = path
-        return Widgets.song_row_to_dict(liststore[path], start=0)
+        song = Widgets.song_row_to_dict(liststore[path], start=0)
+        return ([list_name, path], song)
 
     def locate_curr_song(self):
         '''
@@ -7,6 +7,7 @@ from gi.repository import GObject
 from gi.repository import Gst
 from gi.repository import GstVideo
 from gi.repository import Gtk
+import os
 import sys
 import time
 
@@ -22,6 +23,27 @@ GDK_2BUTTON_PRESS = 5
 # set toolbar icon size to Gtk.IconSize.DND
 ICON_SIZE = 5
 
+# when seeking to a position which is not downloaded yet, it is fetched
+# first, and playing is resumed after it is received, or SEEK_TIMEOUT
+# seconds later. It is checked every SEEK_POLL miliseconds.
+SEEK_TIMEOUT = 5
+SEEK_POLL = 100
+
+# position of playbin is synced when time label, line of lyrics or
+# background image changes, and when next song shall be loaded, instead
+# of polling. The interval is between SYNC_MIN_INTERVAL and
+# SYNC_INTERVAL miliseconds, or SYNC_HIDDEN_INTERVAL when main window is
+# hidden and only the end of song matters.
+SYNC_MIN_INTERVAL = 20
+SYNC_INTERVAL = 1000
+SYNC_HIDDEN_INTERVAL = 10000
+# next song is loaded this long (in nanoseconds) before current one ends.
+LOAD_NEXT_GAP = 800000000
+# lyrics background image is changed every this many seconds.
+BACKGROUND_INTERVAL = 20
+# at most this many background images are loaded for a song.
+BACKGROUND_NUM = 10
+
 # init Gst so that play works ok.
 Gst.init(None)
 GST_LOWER_THAN_1 = (Gst.version()[0] < 1)
@@ -55,8 +77,30 @@ class Player(Gtk.Box):
         self.fullscreen_sid = 0
         self.play_type = PlayType.NONE
         self.adj_timeout = 0
+        # decoded background images of current song, and the index of
+        # the one being shown.
         self.recommend_imgs = None
+        self.recommend_index = -1
         self.curr_song = None
+        # time when a song or mv is requested, used to measure the time
+        # to first sound.
+        self.load_time = 0
+        self.first_sound_time = None
+        self.player_timestamp = 0
+        # (curr_playing, song, song_path) of the next song in playlist,
+        # which is played without gap if it is cached when current song
+        # is about to finish.
+        self.next_song = None
+        self.gapless_song = None
+        # time when current song ended, used to measure the transition.
+        self.switch_time = 0
+        # MediaInfo of current file, read from its header.
+        self.media_info = None
+        # current file is downloaded completely, duration from playbin
+        # is reliable then.
+        self.media_completed = False
+        # duration from playbin, saved after file is completed.
+        self.duration = 0
 
         # use this to keep Net.AsyncSong and Net.AsyncMV object
         self.async_song = None
@@ -70,6 +114,10 @@ class Player(Gtk.Box):
         self.bus.add_signal_watch()
         self.bus.connect('message::eos', self.on_eos)
         self.bus.connect('message::error', self.on_error)
+        self.bus.connect('message::async-done', self.on_async_done)
+        if not GST_LOWER_THAN_1:
+            self.bus.connect('message::stream-start', self.on_stream_start)
+            self.playbin.connect('about-to-finish', self.on_about_to_finish)
         self.playbin.set_property('volume', app.conf['volume'])
 
         event_pic = Gtk.EventBox()
@@ -205,10 +253,14 @@ class Player(Gtk.Box):
         scale_box.pack_start(self.volume, False, False, 0)
 
     def after_init(self):
-        pass
+        self.app.window.connect('show', self.on_view_changed)
+        self.app.window.connect('window-state-event', self.on_view_changed)
+        self.app.notebook.connect('switch-page', self.on_view_changed)
+        Net.download_progress.add_observer(self.on_download_progress)
 
     def do_destroy(self):
         print('Player.do_destroy()')
+        Net.download_progress.remove_observer(self.on_download_progress)
         self.playbin.set_state(Gst.State.NULL)
         if self.async_song:
             self.async_song.destroy()
@@ -229,11 +281,18 @@ class Player(Gtk.Box):
 
         self.play_type = PlayType.SONG
         self.curr_song = song
+        self.load_time = time.time()
+        self.next_song = None
+        self.gapless_song = None
+        self.media_info = None
+        self.media_completed = False
+        self.duration = 0
         self.pause_player(stop=True)
         self.scale.set_fill_level(0)
         self.scale.set_show_fill_level(True)
+        if self.async_song:
+            self.async_song.destroy()
         self.async_song = Net.AsyncSong(self.app)
-        self.async_song.connect('chunk-received', self.on_chunk_received)
         self.async_song.connect('can-play', _on_song_can_play)
         self.async_song.connect('downloaded', _on_song_downloaded)
         self.async_song.get_song(song)
@@ -241,14 +300,23 @@ class Player(Gtk.Box):
     def _load_song(self, song_path):
         print('Player._load_song()', song_path)
         self.playbin.set_property('uri', 'file://' + song_path)
+        self.media_info = self.get_media_info(song_path)
         self.start_player(load=True)
+        self.update_song_info()
+
+    def update_song_info(self):
         self.app.lrc.show_music()
         self.update_player_info()
         self.get_lrc()
         self.get_mv_link()
         self.get_recommend_lists()
+        if self.play_type == PlayType.SONG:
+            self.app.playlist.prefetch_next_links()
+        elif self.play_type == PlayType.RADIO:
+            self.curr_radio_item.prefetch_next_links()
 
     def on_song_downloaded(self, song_path):
+        self.on_media_completed(song_path)
         self.init_adjustment()
         self.scale.set_sensitive(True)
         if self.play_type == PlayType.SONG:
@@ -256,6 +324,84 @@ class Player(Gtk.Box):
             shuffle = self.shuffle_btn.get_active()
             if not shuffle:
                 self.app.playlist.cache_next_song()
+            self.prepare_next_song()
+
+    def prepare_next_song(self):
+        '''
+        Find out the next song and its path, so that it can be played
+        right after current song if it is cached by then.
+        '''
+        def _on_link_received(result, error=None):
+            if not result or self.play_type != PlayType.SONG or \
+                    self.curr_song is not curr_song:
+                return
+            song_link, song_path = result
+            if song_link is False:
+                return
+            self.next_song = (next_playing, song, song_path)
+
+        self.next_song = None
+        curr_song = self.curr_song
+        if self.repeat_type == RepeatType.ONE:
+            next_playing = list(self.app.playlist.curr_playing)
+            song = curr_song
+        else:
+            next_song = self.app.playlist.peek_next_song(
+                    repeat=self.repeat_btn.get_active(),
+                    shuffle=self.shuffle_btn.get_active())
+            if next_song is None:
+                return
+            next_playing, song = next_song
+        Net.async_call(Net.get_song_link, _on_link_received, song,
+                self.app.conf, priority=Net.PRIORITY_PREFETCH)
+
+    def on_about_to_finish(self, playbin):
+        '''
+        Called in streaming thread before current song ends, uri of the
+        next song must be set here to play it without gap.
+        '''
+        next_song = self.next_song
+        if next_song is None or not os.path.exists(next_song[2]):
+            return
+        print('Player: next song is queued:', next_song[2])
+        playbin.set_property('uri', 'file://' + next_song[2])
+        GLib.idle_add(self.on_next_song_queued, next_song)
+
+    def on_next_song_queued(self, next_song):
+        '''
+        State of player is only changed in main loop, next_song is kept
+        until then so that sync_adjustment() does not load_next().
+        '''
+        if self.next_song is not next_song:
+            return False
+        self.gapless_song = next_song
+        self.next_song = None
+        self.switch_time = time.time()
+        return False
+
+    def on_stream_start(self, bus, msg):
+        '''
+        Queued next song starts to play, update state of player.
+        '''
+        if self.gapless_song is None:
+            return
+        next_playing, song, song_path = self.gapless_song
+        self.gapless_song = None
+        print('Player: gapless transition, next song started {0:.2f}s '
+                'after it was queued'.format(time.time() - self.switch_time))
+        self.switch_time = 0
+        if self.async_song:
+            self.async_song.destroy()
+            self.async_song = None
+        self.app.playlist.curr_playing = next_playing
+        self.curr_song = song
+        self.media_completed = False
+        self.duration = 0
+        self.media_info = self.get_media_info(song_path)
+        if self.init_adjustment():
+            GLib.timeout_add(1500, self.init_adjustment)
+        self.update_song_info()
+        self.on_song_downloaded(song_path)
 
     def is_playing(self):
         state = self.playbin.get_state(5)
@@ -264,6 +410,10 @@ class Player(Gtk.Box):
     def init_adjustment(self):
         self.adjustment.set_value(0.0)
         self.adjustment.set_lower(0.0)
+        if self.media_info:
+            self.adjustment.set_upper(self.media_info.length * Gst.SECOND)
+            self.sync_label_by_adjustment()
+            return False
         # when song is not totally downloaded but can play, query_duration
         # might give incorrect/inaccurate result.
         if GST_LOWER_THAN_1:
@@ -277,34 +427,126 @@ class Player(Gtk.Box):
         return True
 
     def sync_adjustment(self):
+        '''
+        Sync scale, time label and lyrics with playbin, then schedule
+        the next sync with get_sync_delay().
+        '''
+        self.adj_timeout = 0
         if GST_LOWER_THAN_1:
             status, _type, curr = self.playbin.query_position(
                 Gst.Format.TIME)
         else:
             status, curr = self.playbin.query_position(Gst.Format.TIME)
         if not status:
-            return True
-        if GST_LOWER_THAN_1:
-            status, _type, total = self.playbin.query_duration(
-                Gst.Format.TIME)
-        else:
-            status, total = self.playbin.query_duration(Gst.Format.TIME)
+            self.schedule_sync(250)
+            return False
+        total = self.get_duration()
         self.adjustment.set_value(curr)
         self.adjustment.set_upper(total)
         self.sync_label_by_adjustment()
-        if curr >= total - 800000000:
+        # a queued next song is switched to by playbin itself.
+        if total > 0 and curr >= total - LOAD_NEXT_GAP and \
+                self.next_song is None and self.gapless_song is None:
             self.load_next()
             return False
-        if self.play_type == PlayType.MV:
-            return True
-        self.app.lrc.sync_lrc(curr)
-        if self.recommend_imgs and len(self.recommend_imgs) > 0:
-            # change lyrics background image every 20 seconds
-            div, mod = divmod(int(curr / 10**9), 20)
-            if mod == 0:
-                div2, mod2 = divmod(div, len(self.recommend_imgs))
-                self.update_lrc_background(self.recommend_imgs[mod2])
-        return True
+        if self.play_type != PlayType.MV:
+            self.app.lrc.sync_lrc(curr)
+            if self.recommend_imgs:
+                # change lyrics background image every 20 seconds
+                div, mod = divmod(int(curr / 10**9), BACKGROUND_INTERVAL)
+                if mod == 0:
+                    self.update_lrc_background(
+                            div % len(self.recommend_imgs))
+        self.schedule_sync(self.get_sync_delay(curr, total))
+        return False
+
+    def schedule_sync(self, delay):
+        if self.adj_timeout > 0:
+            GLib.source_remove(self.adj_timeout)
+        self.adj_timeout = GLib.timeout_add(delay, self.sync_adjustment)
+
+    def get_sync_delay(self, curr, total):
+        '''
+        Get miliseconds to the next moment when something on screen
+        changes, or to the point to load next song.
+        '''
+        moments = []
+        # a queued next song is switched to without load_next().
+        if total > 0 and curr < total - LOAD_NEXT_GAP and \
+                self.next_song is None and self.gapless_song is None:
+            moments.append(total - LOAD_NEXT_GAP)
+        if self.is_window_visible():
+            max_delay = SYNC_INTERVAL
+            moments.append((curr // Gst.SECOND + 1) * Gst.SECOND)
+            # lyrics and background are only seen in lrc page.
+            if self.play_type != PlayType.MV and \
+                    self.app.notebook.get_current_page() == \
+                    self.app.lrc.app_page:
+                next_line = self.app.lrc.get_next_time(curr)
+                if next_line is not None:
+                    moments.append(next_line)
+                if self.recommend_imgs:
+                    interval = BACKGROUND_INTERVAL * Gst.SECOND
+                    moments.append((curr // interval + 1) * interval)
+        else:
+            max_delay = SYNC_HIDDEN_INTERVAL
+        if not moments:
+            return max_delay
+        # wake up a little later, so that the moment is passed.
+        delay = (min(moments) - curr) // 10**6 + SYNC_MIN_INTERVAL
+        return int(min(max(delay, SYNC_MIN_INTERVAL), max_delay))
+
+    def get_duration(self):
+        '''
+        Duration from playbin when file is downloaded completely, or else
+        the one read from header, which might be estimated.
+        '''
+        if self.duration:
+            return self.duration
+        if self.media_completed or not self.media_info:
+            if GST_LOWER_THAN_1:
+                status, _type, total = self.playbin.query_duration(
+                    Gst.Format.TIME)
+            else:
+                status, total = self.playbin.query_duration(
+                        Gst.Format.TIME)
+            if status and total > 0:
+                # it does not change once file is completed.
+                if self.media_completed:
+                    self.duration = total
+                return total
+        if self.media_info:
+            return self.media_info.length * Gst.SECOND
+        return 0
+
+    def on_media_completed(self, filepath):
+        '''
+        Current file is downloaded, parse the whole file again instead of
+        the estimate from its head.
+        '''
+        self.media_completed = True
+        media_info = Net.get_media_info(None, filepath)
+        if media_info:
+            self.media_info = media_info
+        return False
+
+    def is_window_visible(self):
+        window = self.app.window
+        if not window.get_visible():
+            return False
+        gdk_window = window.get_window()
+        if gdk_window is None:
+            return False
+        return not gdk_window.get_state() & Gdk.WindowState.ICONIFIED
+
+    def on_view_changed(self, *args):
+        '''
+        Main window is shown, hidden or switched to another page, sync at
+        once if player is running.
+        '''
+        if self.adj_timeout > 0:
+            self.schedule_sync(SYNC_MIN_INTERVAL)
+        return False
 
     def sync_label_by_adjustment(self):
         curr = delta(self.adjustment.get_value())
@@ -362,14 +604,21 @@ class Player(Gtk.Box):
     def start_player(self, load=False):
         self.play_button.set_icon_name('media-playback-pause-symbolic')
         self.playbin.set_state(Gst.State.PLAYING)
-        self.adj_timeout = GLib.timeout_add(250, self.sync_adjustment)
-        if load:
+        self.schedule_sync(250)
+        # duration is read from header at once if possible.
+        if load and self.init_adjustment():
             GLib.timeout_add(1500, self.init_adjustment)
 
     def pause_player(self, stop=False):
+        '''
+        If stop is True, current file is closed to switch to another one.
+        Playbin only goes back to READY, so that its sinks and the opened
+        audio device are reused by the next file, it is set to NULL only
+        when player is destroyed.
+        '''
         self.play_button.set_icon_name('media-playback-start-symbolic')
         if stop:
-            self.playbin.set_state(Gst.State.NULL)
+            self.playbin.set_state(Gst.State.READY)
             self.scale.set_value(0)
             self.scale.set_sensitive(False)
             self.show_mv_btn.set_sensitive(False)
@@ -395,18 +644,63 @@ class Player(Gtk.Box):
             return
 
         self.pause_player()
-        self.playbin.seek_simple(Gst.Format.TIME, 
-                Gst.SeekFlags.FLUSH | Gst.SeekFlags.KEY_UNIT,
-                self.adjustment.get_value())
         self.sync_label_by_adjustment()
         self.player_timestamp = time.time()
         GLib.timeout_add(500, self._delay_play, self.player_timestamp)
 
     def _delay_play(self, local_timestamp):
-        if self.player_timestamp == local_timestamp:
+        if self.player_timestamp != local_timestamp:
+            return False
+        position = self.adjustment.get_value()
+        target = None
+        async_download = self.get_async_download()
+        if async_download:
+            target = async_download.seek(position / Gst.SECOND,
+                    self.adjustment.get_upper() / Gst.SECOND)
+        if target is None:
+            self.seek_player(position)
             self.start_player()
+            return False
+        GLib.timeout_add(SEEK_POLL, self._wait_seek, local_timestamp,
+                async_download, target)
+        return False
+
+    def _wait_seek(self, local_timestamp, async_download, target):
+        '''
+        Wait for data at the position of seeking to be downloaded.
+        '''
+        if self.player_timestamp != local_timestamp:
+            return False
+        waited = time.time() - local_timestamp
+        if not async_download.is_received(target) and \
+                waited < SEEK_TIMEOUT:
+            return True
+        print('Player: seek resumed after {0:.2f}s'.format(waited))
+        self.seek_player(self.adjustment.get_value())
+        self.start_player()
         return False
 
+    def seek_player(self, position):
+        self.playbin.seek_simple(Gst.Format.TIME, 
+                Gst.SeekFlags.FLUSH | Gst.SeekFlags.KEY_UNIT, position)
+
+    def get_media_info(self, filepath):
+        transfer = None
+        async_download = self.get_async_download()
+        if async_download:
+            transfer = async_download.transfer
+        return Net.get_media_info(transfer, filepath)
+
+    def get_async_download(self):
+        '''
+        AsyncSong or AsyncMV of the file being played.
+        '''
+        if self.play_type == PlayType.MV:
+            return self.async_mv
+        if self.play_type in (PlayType.SONG, PlayType.RADIO):
+            return self.async_song
+        return None
+
     def on_volume_value_changed(self, volume, value):
         # reduce volume value because in 0~0.2 it is too sensitive
         mod_value = value ** 3
@@ -439,30 +733,48 @@ class Player(Gtk.Box):
         self.label.set_label(label)
         self.artist_pic.set_from_pixbuf(self.app.theme['anonymous'])
         Net.async_call(Net.get_artist_info, _update_pic, 
-                song['artistid'], song['artist'])
+                song['artistid'], song['artist'],
+                priority=Net.PRIORITY_LRC)
 
     def get_lrc(self):
         def _update_lrc(lrc_text, error=None):
             self.app.lrc.set_lrc(lrc_text)
-        Net.async_call(Net.get_lrc, _update_lrc, self.curr_song['rid'])
+        Net.async_call(Net.get_lrc, _update_lrc, self.curr_song['rid'],
+                priority=Net.PRIORITY_LRC)
 
     def get_recommend_lists(self):
-        self.recommend_imgs = None
+        '''
+        Load background images of lyrics in background as soon as a song
+        starts, they are shown after being decoded.
+        '''
         def _on_list_received(imgs, error=None):
-            if imgs is None or len(imgs) < 10:
-                self.recommend_imgs = None
-            else:
-                self.recommend_imgs = imgs.splitlines()
+            if imgs is None or len(imgs) < 10 or \
+                    self.curr_song is not curr_song:
+                return
+            urls = [url.strip() for url in imgs.splitlines() if url.strip()]
+            for url in urls[:BACKGROUND_NUM]:
+                Net.async_call(Net.get_recommend_pixbuf, _on_image_loaded,
+                        url, priority=Net.PRIORITY_PREFETCH)
+
+        def _on_image_loaded(pix, error=None):
+            if pix and self.curr_song is curr_song and \
+                    pix not in self.recommend_imgs:
+                self.recommend_imgs.append(pix)
+
+        curr_song = self.curr_song
+        self.recommend_imgs = []
+        self.recommend_index = -1
         Net.async_call(Net.get_recommend_lists, _on_list_received, 
-                self.curr_song['artist'])
+                self.curr_song['artist'], priority=Net.PRIORITY_PREFETCH)
 
-    def update_lrc_background(self, url):
-        def _update_background(filepath, error=None):
-            if filepath:
-                self.app.lrc.update_background(filepath)
-        Net.async_call(Net.get_recommend_image, _update_background, url)
+    def update_lrc_background(self, index):
+        if index == self.recommend_index:
+            return
+        self.recommend_index = index
+        self.app.lrc.update_background(self.recommend_imgs[index])
 
     def on_eos(self, bus, msg):
+        self.switch_time = time.time()
         self.pause_player(stop=True)
         if self.repeat_type == RepeatType.ONE:
             if self.play_type == PlayType.MV:
@@ -476,8 +788,14 @@ class Player(Gtk.Box):
         if self.play_type == PlayType.RADIO:
             self.curr_radio_item.play_next_song()
         elif self.play_type == PlayType.SONG:
-            next_song = self.app.playlist.get_next_song(
-                    repeat=_repeat, shuffle=_shuffle)
+            # the song chosen by prepare_next_song() is played, so that
+            # the shuffled order is not picked again.
+            if self.next_song is not None:
+                next_playing, next_song, song_path = self.next_song
+                self.app.playlist.curr_playing = next_playing
+            else:
+                next_song = self.app.playlist.get_next_song(
+                        repeat=_repeat, shuffle=_shuffle)
             if next_song is not None:
                 self.load(next_song)
         elif self.play_type == PlayType.MV:
@@ -489,6 +807,18 @@ class Player(Gtk.Box):
     def on_error(self, bus, msg):
         print('on_error():', msg.parse_error())
 
+    def on_async_done(self, bus, msg):
+        # pipeline is prerolled, the first sound is being played.
+        if self.load_time:
+            self.first_sound_time = time.time() - self.load_time
+            self.load_time = 0
+            print('Player: time to first sound: {0:.2f}s'.format(
+                self.first_sound_time))
+        if self.switch_time:
+            print('Player: transition after end of song: {0:.2f}s'.format(
+                time.time() - self.switch_time))
+            self.switch_time = 0
+
     # Radio part
     def load_radio(self, song, radio_item):
         '''
@@ -498,15 +828,25 @@ class Player(Gtk.Box):
         def _on_radio_can_play(widget, song):
             GLib.idle_add(self._load_song, song)
 
-        def _on_radio_downloaded(*args):
+        def _on_radio_downloaded(widget, song_path):
+            if song_path:
+                GLib.idle_add(self.on_media_completed, song_path)
             self.scale.set_sensitive(True)
             self.curr_radio_item.cache_next_song()
 
         self.play_type = PlayType.RADIO
+        self.load_time = time.time()
+        self.next_song = None
+        self.gapless_song = None
+        self.media_info = None
+        self.media_completed = False
+        self.duration = 0
         self.pause_player(stop=True)
         self.curr_radio_item = radio_item
         self.curr_song = song
         self.scale.set_sensitive(False)
+        if self.async_song:
+            self.async_song.destroy()
         self.async_song = Net.AsyncSong(self.app)
         self.async_song.connect('can-play', _on_radio_can_play)
         self.async_song.connect('downloaded', _on_radio_downloaded)
@@ -530,10 +870,17 @@ class Player(Gtk.Box):
             # TODO, FIXME
             #self.disable_bus_sync()
 
-    def on_chunk_received(self, widget, percent):
-        def _update_fill_level(value):
-            self.scale.set_fill_level(value)
-        GLib.idle_add(_update_fill_level, percent)
+    def on_download_progress(self, pending):
+        '''
+        Observer of Net.download_progress, called in main loop with
+        progress of all downloads, at most 4 times a second.
+        '''
+        async_download = self.get_async_download()
+        if not async_download or not async_download.transfer:
+            return
+        progress = pending.get(async_download.transfer.key)
+        if progress and progress[0] is not None and progress[1]:
+            self.scale.set_fill_level(int(progress[0] / progress[1] * 100))
 
     def load_mv(self, song):
         def _on_mv_can_play(widget, mv_path):
@@ -547,11 +894,18 @@ class Player(Gtk.Box):
 
         self.play_type = PlayType.MV
         self.curr_song = song
+        self.load_time = time.time()
+        self.next_song = None
+        self.gapless_song = None
+        self.media_info = None
+        self.media_completed = False
+        self.duration = 0
         self.pause_player(stop=True)
         self.scale.set_fill_level(0)
         self.scale.set_show_fill_level(True)
+        if self.async_mv:
+            self.async_mv.destroy()
         self.async_mv = Net.AsyncMV(self.app)
-        self.async_mv.connect('chunk-received', self.on_chunk_received)
         self.async_mv.connect('can-play', _on_mv_can_play)
         self.async_mv.connect('downloaded', _on_mv_downloaded)
         self.async_mv.get_mv(song)
@@ -559,6 +913,7 @@ class Player(Gtk.Box):
     def _load_mv(self, mv_path):
         self.update_player_info()
         self.playbin.set_property('uri', 'file://' + mv_path)
+        self.media_info = self.get_media_info(mv_path)
         self.app.lrc.show_mv()
         self.enable_bus_sync()
         self.start_player(load=True)
@@ -572,6 +927,7 @@ class Player(Gtk.Box):
         self._load_mv(mv_path)
 
     def on_mv_downloaded(self, mv_path):
+        self.on_media_completed(mv_path)
         self.scale.set_sensitive(True)
 
     def get_mv_link(self):
@@ -581,7 +937,8 @@ class Player(Gtk.Box):
             print('mv_link, mv_path:', mv_link, mv_path)
             self.show_mv_btn.set_sensitive(mv_link is not False)
         Net.async_call(Net.get_song_link, _update_mv_link,
-                self.curr_song, self.app.conf, True)
+                self.curr_song, self.app.conf, True,
+                priority=Net.PRIORITY_PLAYBACK)
 
     def enable_bus_sync(self):
         self.bus.enable_sync_message_emission()
@@ -124,6 +124,18 @@ class Preferences(Gtk.Dialog):
         status_button.connect('toggled', self.on_status_button_toggled)
         generic_box.pack_start(status_button, False, False, 0)
 
+        cache_workers_box = Gtk.Box()
+        cache_workers_box.props.margin_top = MARGIN_TOP
+        generic_box.pack_start(cache_workers_box, False, False, 0)
+        cache_workers_label = Widgets.BoldLabel(
+                _('Songs cached at the same time'))
+        cache_workers_box.pack_start(cache_workers_label, False, False, 0)
+        cache_workers = Gtk.SpinButton.new_with_range(1, 8, 1)
+        cache_workers.set_value(app.conf['cache-workers'])
+        cache_workers.connect('value-changed',
+                self.on_cache_workers_changed)
+        cache_workers_box.pack_start(cache_workers, False, False, 20)
+
         # format tab
         format_box = NoteTab()
         notebook.append_page(format_box, Gtk.Label(_('Format')))
@@ -227,6 +239,9 @@ class Preferences(Gtk.Dialog):
     def on_status_button_toggled(self, button):
         self.app.conf['use-status-icon'] = button.get_active()
 
+    def on_cache_workers_changed(self, spin):
+        self.app.conf['cache-workers'] = spin.get_value_as_int()
+
     def on_audio_toggled(self, radiobtn):
         self.app.conf['use-ape'] = radiobtn.get_group()[0].get_active()
 
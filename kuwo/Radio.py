@@ -9,6 +9,7 @@ import json
 import os
 
 from kuwo import Config
+from kuwo import Download
 from kuwo import Net
 from kuwo import Widgets
 
@@ -178,7 +179,7 @@ class RadioItem(Gtk.EventBox):
             song = radio['songs'][radio['curr_song'] + 1]
             print('next song to cache:', song)
             parse_song = Net.AsyncSong(self.app)
-            parse_song.get_song(song)
+            parse_song.get_song(song, Download.PRIORITY_NEXT)
         index = self.get_index()
         radio = self.playlists[index]
         # TODO: check curr_song > 19
@@ -188,6 +189,12 @@ class RadioItem(Gtk.EventBox):
             return
         _cache_next_song()
 
+    def prefetch_next_links(self):
+        radio = self.playlists[self.get_index()]
+        start = radio['curr_song'] + 1
+        songs = radio['songs'][start:start+Net.LINK_BATCH]
+        Net.prefetch_song_links(songs, self.app.conf)
+
     def on_button_pressed(self, widget, event):
         parent = self.get_parent()
         children = parent.get_children()
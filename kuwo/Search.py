@@ -173,6 +173,7 @@ class Search(Gtk.Box):
         if len(keyword) == 0:
             return
         if reset_status:
+            Net.cancel_tasks(self.liststore_artists)
             self.liststore_artists.clear()
         Net.async_call(Net.search_artists, _append_artists,
                 keyword, self.artists_page)
@@ -207,6 +208,7 @@ class Search(Gtk.Box):
         if len(keyword) == 0:
             return
         if reset_status:
+            Net.cancel_tasks(self.liststore_albums)
             self.liststore_albums.clear()
         Net.async_call(Net.search_albums, _append_albums,
                 keyword, self.albums_page)
@@ -221,7 +223,9 @@ class Search(Gtk.Box):
         self.albums_button.set_label(_('Albums'))
 
         self.liststore_songs.clear()
+        Net.cancel_tasks(self.liststore_artists)
         self.liststore_artists.clear()
+        Net.cancel_tasks(self.liststore_albums)
         self.liststore_albums.clear()
 
         self.songs_page = 0
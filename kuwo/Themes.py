@@ -101,6 +101,7 @@ class Themes(Gtk.Box):
             self.scrolled_sub.get_vadjustment().set_value(0)
             self.scrolled_sub.show_all()
             self.nodes_page = 0
+            Net.cancel_tasks(self.liststore_sub)
             self.liststore_sub.clear()
         nodes, self.nodes_total = Net.get_nodes(self.curr_sub_id,
                 self.nodes_page)
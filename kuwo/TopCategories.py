@@ -134,6 +134,7 @@ class TopCategories(Gtk.Box):
             self.scrolled_sub1.get_vadjustment().set_value(0)
             self.scrolled_sub1.show_all()
             self.sub1_page = 0
+            Net.cancel_tasks(self.liststore_sub1)
             self.liststore_sub1.clear()
         Net.async_call(Net.get_nodes, _show_sub1,
                 self.curr_sub1_id, self.sub1_page)
@@ -175,6 +176,7 @@ class TopCategories(Gtk.Box):
             self.scrolled_sub2.get_vadjustment().set_value(0)
             self.scrolled_sub2.show_all()
             self.sub2_page = 0
+            Net.cancel_tasks(self.liststore_sub2)
             self.liststore_sub2.clear()
         Net.async_call(Net.get_nodes, _show_sub2,
                 self.curr_sub2_id, self.sub2_page)
@@ -2,6 +2,7 @@
 import base64
 import json
 import os
+import re
 import sys
 from urllib import parse
 import zlib
@@ -73,11 +74,52 @@ def decode_lrc_url(url):
     #print(output.decode('gb2312'))
     return output.decode('gb2312')
 
-def json_loads_single(_str):
+# Kuwo servers return json with single quotes, like {'name':'value'}.
+_SINGLE_TO_DOUBLE = bytes.maketrans(b"'", b'"')
+# A single quote inside of a string is only treated as the end of it
+# if it is followed by one of `,:}]`.
+_SINGLE_QUOTED = re.compile(rb"""'((?:[^'\\]|\\.|'(?!\s*[,:}\]]))*)'""",
+        re.S)
+_JSON_DECODER = json.JSONDecoder(strict=False)
+
+def _quote_single(match):
+    _str = match.group(1)
+    if b'\\' in _str:
+        _str = _str.replace(b'\\"', b'"').replace(b"\\'", b"'")
+    if b'"' in _str:
+        _str = _str.replace(b'"', b'\\"')
+    return b'"' + _str + b'"'
+
+def _translate_single(data, tolerant=False):
     '''
-    Actually this is not a good idea.
+    Convert single-quoted json bytes to standard json str.
+    In normal mode, quotes are swapped in one pass of bytes.translate();
+    in tolerant mode each quoted string is tokenized, so that escaped
+    quotes and quotes inside of strings are handled.
     '''
-    return json.loads(_str.replace('"', '''\\"''').replace("'", '"'))
+    if tolerant:
+        return _SINGLE_QUOTED.sub(_quote_single, data).decode()
+    if b'"' in data:
+        data = data.replace(b'"', b'\\"')
+    return data.translate(_SINGLE_TO_DOUBLE).decode()
+
+def _need_tolerant(data):
+    return b'\\' in data and (b"\\'" in data or b'\\"' in data)
+
+def json_loads_single(data):
+    '''
+    Decode json with single quotes, data is bytes (or str) returned by
+    kuwo servers.
+    The fast mode is used first, and if it fails, the tolerant one.
+    '''
+    if isinstance(data, str):
+        data = data.encode()
+    if not _need_tolerant(data):
+        try:
+            return _JSON_DECODER.decode(_translate_single(data))
+        except ValueError:
+            pass
+    return _JSON_DECODER.decode(_translate_single(data, tolerant=True))
 
 def encode_uri(text):
     return parse.quote(text, safe='~@#$&()*!+=:;,.?/\'')
@@ -101,6 +143,16 @@ def parse_radio_songs(txt):
             })
     return songs
 
+def format_size(size):
+    '''
+    Convert bytes to a readable string, like 1.2 MB.
+    '''
+    for unit in ('B', 'kB', 'MB'):
+        if size < 1024:
+            return '{0:.1f} {1}'.format(size, unit)
+        size = size / 1024
+    return '{0:.1f} GB'.format(size)
+
 def iconvtag(song_path, song):
     # Do nothing if python3 version is lower than 3.3
     if is_py33 is False:
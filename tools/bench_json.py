@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+'''
+Compare decoding of a search result (100 songs, single-quoted json from
+kuwo servers) by the old str.replace() way and Utils.json_loads_single().
+
+    python3 tools/bench_json.py
+'''
+
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from kuwo import Utils
+
+SONG = ("{'ALBUM':'Album %d','ALBUMID':'123456','ARTIST':'Artist \"x\"',"
+        "'ARTISTID':'336','NAME':'Song %d','MUSICRID':'MUSIC_%d',"
+        "'FORMATS':'WMA96|WMA128|MP3H|MP3192|MP3128|AAC48|AAC24',"
+        "'SCORE100':'%d','PLAYCNT':'1234','ONLINE':'1','PAY':'0',"
+        "'COPYRIGHT':'0','MVFLAG':'1','SUBLIST':[],'tag':''}")
+NUM = 1000
+
+def old_loads(data):
+    text = data.decode()
+    return json.loads(text.replace('"', '''\\"''').replace("'", '"'))
+
+def make_payload(quotes):
+    songs = ','.join(SONG % (i, i, i, i) for i in range(100))
+    payload = ("{'TOTAL':'5432','SHOW':'1','HIT':'5432','PN':'0',"
+               "'RN':'100','abslist':[" + songs + "]}").encode()
+    if not quotes:
+        payload = payload.replace(b'"x"', b'x')
+    return payload
+
+def main():
+    for quotes in (False, True):
+        payload = make_payload(quotes)
+        assert Utils.json_loads_single(payload) == old_loads(payload)
+        old = timeit.timeit(lambda: old_loads(payload), number=NUM)
+        new = timeit.timeit(lambda: Utils.json_loads_single(payload),
+                number=NUM)
+        print('{0} bytes, quotes in values: {1}, old: {2:.3f}ms, '
+              'new: {3:.3f}ms'.format(len(payload), quotes,
+                  old / NUM * 1000, new / NUM * 1000))
+    tricky = (b"{'NAME':'Rock 'n' Roll','A':'He said \\'hi\\'',"
+              b"'B':'x \\\"y\\\"'}")
+    print('tolerant mode:', Utils.json_loads_single(tricky))
+
+if __name__ == '__main__':
+    main()
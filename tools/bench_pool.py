@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+'''
+Send sequential requests to a local keep-alive server, with
+urllib.request.urlopen() and with Net.urlopen() through Net.http_pool,
+then print how many TCP connections were opened.
+With all pooled connections held open, Net.urlopen() must return once
+its deadline passes instead of waiting forever.
+
+    python3 tools/bench_pool.py [requests]
+'''
+
+import sys
+import time
+from urllib import request
+
+from benchutils import import_kuwo, start_server
+
+Net = import_kuwo()
+
+
+def main():
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    server, url = start_server(b'x' * 2000)
+
+    start = time.time()
+    for i in range(num):
+        request.urlopen(url + str(i)).read()
+    print('urllib: {0} requests, {1} connections, {2:.2f}s'.format(
+        num, server.stats['connections'], time.time() - start))
+
+    server.stats['connections'] = 0
+    start = time.time()
+    for i in range(num):
+        Net.urlopen(url + str(i), use_cache=False)
+    print('pool:   {0} requests, {1} connections, {2:.2f}s'.format(
+        num, server.stats['connections'], time.time() - start))
+
+    server.data = b'x' * 2 ** 20
+    held = [Net.http_pool.urlopen(url + 'held' + str(i))
+            for i in range(Net.http_pool.max_total)]
+    start = time.time()
+    result = Net.urlopen(url + 'free', use_cache=False)
+    print('full pool: urlopen() returned {0!r} after {1:.1f}s '
+          '(REQ_DEADLINE {2}s)'.format(result, time.time() - start,
+              Net.REQ_DEADLINE))
+    for resp in held:
+        resp.close()
+
+if __name__ == '__main__':
+    main()
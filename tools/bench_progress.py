@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+'''
+Download a 40MB song with Net.AsyncSong from a local server, and count
+chunks, chunk-received signals and flushes of Net.download_progress,
+first without an observer, then with one like Player.
+Flushes are scheduled with threading.Timer here instead of
+GObject.timeout_add(), so that no GLib main loop is needed.
+
+    python3 tools/bench_progress.py
+'''
+
+import os
+import tempfile
+import threading
+import time
+
+from benchutils import import_kuwo, start_server
+
+Net = import_kuwo()
+
+SIZE = 40 * 2 ** 20
+RATE = 8 * 2 ** 20
+
+
+class App:
+    conf = {}
+
+
+def schedule(func, delay):
+    schedules[0] += 1
+    threading.Timer(delay, func).start()
+
+schedules = [0]
+
+
+def run(url, filepath, observer):
+    progress = Net.download_progress
+    progress.schedule = schedule
+    for key in progress.stats:
+        progress.stats[key] = 0
+    schedules[0] = 0
+    flushes = [0]
+    signals = [0]
+    done = threading.Event()
+
+    def on_progress(pending):
+        flushes[0] += 1
+
+    if observer:
+        progress.add_observer(on_progress)
+    Net.get_song_link = lambda song, conf, use_mv=False: (url, filepath)
+    async_song = Net.AsyncSong(App())
+    async_song.connect('chunk-received',
+            lambda widget, percent: signals.__setitem__(0, signals[0] + 1))
+    async_song.connect('downloaded', lambda widget, path: done.set())
+    start = time.time()
+    async_song.get_song({'rid': observer, 'artist': 'a', 'name': 'b'})
+    done.wait(60)
+    elapsed = time.time() - start
+    time.sleep(0.5)
+    progress.remove_observer(on_progress)
+    size = SIZE / 2 ** 20
+    print('observer: {0}, {1:.0f}MB in {2:.1f}s, {3} chunks ({4:.0f}/MB), '
+          '{5} chunk-received, {6} scheduled, {7} observer '
+          'flushes'.format(observer, size, elapsed,
+              progress.stats['updates'],
+              progress.stats['updates'] / size, signals[0], schedules[0],
+              flushes[0]))
+
+def main():
+    data = os.urandom(SIZE)
+    server, url = start_server(data, rate=RATE)
+    tmp_dir = tempfile.mkdtemp()
+    for observer in (False, True):
+        filepath = os.path.join(tmp_dir, '{0}.mp3'.format(observer))
+        run(url, filepath, observer)
+
+if __name__ == '__main__':
+    main()
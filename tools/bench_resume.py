@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+'''
+Download a 5MB file from a local server which drops every connection
+after 2MB. Each retry resumes the .part file with a Range request, so
+the file is completed in 3 requests, without downloading any byte twice.
+
+    python3 tools/bench_resume.py
+'''
+
+import os
+import tempfile
+
+from benchutils import import_kuwo, start_server
+
+Net = import_kuwo()
+from kuwo import Download
+
+SIZE = 5 * 2 ** 20
+CUT_SIZE = 2 * 2 ** 20
+
+
+def main():
+    data = os.urandom(SIZE)
+    server, url = start_server(data, cut_size=CUT_SIZE)
+    filepath = os.path.join(tempfile.mkdtemp(), 'song.mp3')
+    tries = 0
+    while tries < 10:
+        tries += 1
+        download = Download.Download(Net.http_pool, url, filepath)
+        download.load_meta()
+        try:
+            if download.run():
+                break
+        except Exception as e:
+            print('try {0}: {1} bytes received, {2}'.format(tries,
+                download.received, type(e).__name__))
+    with open(filepath, 'rb') as fh:
+        completed = fh.read() == data
+    print('{0} requests, {1} bytes sent for a {2} bytes file, '
+          'completed: {3}'.format(server.stats['requests'],
+              server.stats['sent'], SIZE, completed))
+
+if __name__ == '__main__':
+    main()
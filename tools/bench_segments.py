@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+'''
+Download a 24MB file from a local server limited to 8MB/s for each
+connection, with 1, 2 and 4 segments, and print the total time and when
+the first Net.CHUNK_TO_PLAY bytes were playable.
+Then check that api requests are still served while the bulk
+connections of the pool are all in use.
+
+    python3 tools/bench_segments.py
+'''
+
+import os
+import tempfile
+import time
+
+from benchutils import import_kuwo, start_server
+
+Net = import_kuwo()
+from kuwo import Download
+
+SIZE = 24 * 2 ** 20
+RATE = 8 * 2 ** 20
+
+
+def run(url, filepath, segments):
+    playable = []
+    start = time.time()
+
+    def on_chunk(received, length):
+        if not playable and received >= Net.CHUNK_TO_PLAY:
+            playable.append(time.time() - start)
+
+    download = Download.Download(Net.http_pool, url, filepath,
+            segments=segments, head_size=Net.CHUNK_TO_PLAY)
+    download.run(on_chunk)
+    elapsed = time.time() - start
+    print('{0} segments: {1:.2f}s, {2:.1f}MB/s, playable after '
+          '{3:.2f}s'.format(segments, elapsed, SIZE / elapsed / 2 ** 20,
+              playable[0]))
+
+def main():
+    data = os.urandom(SIZE)
+    server, url = start_server(data, rate=RATE)
+    tmp_dir = tempfile.mkdtemp()
+    for segments in (1, 2, 4):
+        filepath = os.path.join(tmp_dir, '{0}.ape'.format(segments))
+        run(url, filepath, segments)
+        with open(filepath, 'rb') as fh:
+            assert fh.read() == data
+
+    pool = Net.http_pool
+    held = [pool.urlopen(url, bulk=True) for i in range(pool.max_bulk)]
+    start = time.time()
+    try:
+        pool.urlopen(url, timeout=1, bulk=True)
+    except TimeoutError:
+        print('bulk request waited {0:.1f}s with {1} bulk connections '
+              'in use'.format(time.time() - start, pool.max_bulk))
+    server.data = b'x' * 2000
+    start = time.time()
+    Net.urlopen(url + 'api', use_cache=False)
+    print('api request served in {0:.3f}s'.format(time.time() - start))
+    for resp in held:
+        resp.close()
+
+if __name__ == '__main__':
+    main()
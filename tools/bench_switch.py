@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+'''
+Measure track switches of playbin with fakesink, like Player does on
+EOS: the playbin is stopped at NULL (old way) or READY (new way), a new
+uri is set, then the time until ASYNC_DONE is measured.
+GStreamer and PyGObject are required.
+
+    python3 tools/bench_switch.py [switches]
+'''
+
+import math
+import os
+import struct
+import sys
+import tempfile
+import time
+import wave
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+Gst.init(None)
+
+RATE = 44100
+# length of each test file, in seconds.
+LENGTH = 0.5
+
+def make_wav(path, freq):
+    with wave.open(path, 'wb') as fh:
+        fh.setnchannels(2)
+        fh.setsampwidth(2)
+        fh.setframerate(RATE)
+        frames = []
+        for i in range(int(RATE * LENGTH)):
+            value = int(8000 * math.sin(2 * math.pi * freq * i / RATE))
+            frames.append(struct.pack('<hh', value, value))
+        fh.writeframes(b''.join(frames))
+
+def make_playbin():
+    playbin = Gst.ElementFactory.make('playbin', None)
+    audio_sink = Gst.ElementFactory.make('fakesink', None)
+    audio_sink.set_property('sync', True)
+    playbin.set_property('audio-sink', audio_sink)
+    playbin.set_property('video-sink', Gst.ElementFactory.make('fakesink',
+        None))
+    return playbin
+
+def wait_for(bus, msg_type):
+    msg = bus.timed_pop_filtered(10 * Gst.SECOND,
+            msg_type | Gst.MessageType.ERROR)
+    if msg is None:
+        raise TimeoutError('no {0} message in 10s'.format(msg_type))
+    if msg.type == Gst.MessageType.ERROR:
+        raise RuntimeError(msg.parse_error())
+
+def run(files, stop_state, switches):
+    playbin = make_playbin()
+    bus = playbin.get_bus()
+    times = []
+    for i in range(switches):
+        start = time.time()
+        playbin.set_state(stop_state)
+        playbin.set_property('uri', 'file://' + files[i % len(files)])
+        playbin.set_state(Gst.State.PLAYING)
+        wait_for(bus, Gst.MessageType.ASYNC_DONE)
+        times.append(time.time() - start)
+    playbin.set_state(Gst.State.NULL)
+    return times
+
+def main():
+    switches = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    tmp_dir = tempfile.mkdtemp()
+    files = []
+    for i, freq in enumerate((220, 330, 440, 550)):
+        path = os.path.join(tmp_dir, '{0}.wav'.format(i))
+        make_wav(path, freq)
+        files.append(path)
+    for name, state in (('NULL', Gst.State.NULL),
+                        ('READY', Gst.State.READY)):
+        times = sorted(run(files, state, switches))
+        print('{0:5}: {1} switches, mean {2:.2f}ms, median {3:.2f}ms, '
+              'max {4:.2f}ms'.format(name, switches,
+                  sum(times) / len(times) * 1000,
+                  times[len(times) // 2] * 1000, times[-1] * 1000))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+'''
+Helpers shared by the benchmarks in this directory: a local HTTP/1.1
+server, and importing kuwo with a temporary config dir, so that the
+cache and settings of user are not touched.
+'''
+
+import http.server
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_kuwo():
+    '''
+    Use a temporary HOME, then import kuwo.Config and kuwo.Net.
+    PyGObject is required by kuwo.Net.
+    '''
+    home = tempfile.mkdtemp()
+    os.makedirs(os.path.join(home, '.config'))
+    os.environ['HOME'] = home
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    from kuwo import Config
+    Config.check_first()
+    from kuwo import Net
+    return Net
+
+
+class Server(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients may close connections at any time.
+        pass
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    '''
+    Serve server.data, with Range, ETag and keep-alive.
+    server.rate limits bytes/s of each connection, server.cut_size drops
+    the connection after sending this many bytes of a response.
+    '''
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        with self.server.lock:
+            self.server.stats['connections'] += 1
+        super().setup()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        data = self.server.data
+        start, end = 0, len(data) - 1
+        range_ = self.headers.get('Range')
+        if range_:
+            first, last = range_.split('=')[1].split('-')
+            start = int(first)
+            if last:
+                end = min(int(last), end)
+        body = data[start:end+1]
+        if range_:
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {0}-{1}/{2}'.format(
+                start, end, len(data)))
+        else:
+            self.send_response(200)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', '"bench"')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        with self.server.lock:
+            self.server.stats['requests'] += 1
+        if self.server.cut_size:
+            body = body[:self.server.cut_size]
+            self.close_connection = True
+        step = 2 ** 16
+        try:
+            for i in range(0, len(body), step):
+                self.wfile.write(body[i:i+step])
+                with self.server.lock:
+                    self.server.stats['sent'] += len(body[i:i+step])
+                if self.server.rate:
+                    time.sleep(step / self.server.rate)
+        except OSError:
+            pass
+
+
+def start_server(data, rate=0, cut_size=0):
+    '''
+    Start a threading server in background, returns (server, url).
+    '''
+    server = Server(('127.0.0.1', 0), Handler)
+    server.data = data
+    server.rate = rate
+    server.cut_size = cut_size
+    server.lock = threading.Lock()
+    server.stats = {'connections': 0, 'requests': 0, 'sent': 0}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = 'http://127.0.0.1:{0}/'.format(server.server_port)
+    return (server, url)